@@ -1 +1,11 @@
 __version__ = '1.0.1'  # pragma no cover
+
+
+def render_many(*args, **kwargs):
+    """
+    Render a template with many contexts; see ``pedant.batch.render_many``.
+    """
+    # Imported here so that importing pedant (e.g. from setup.py) doesn't
+    # need django.
+    from pedant.batch import render_many
+    return render_many(*args, **kwargs)
@@ -0,0 +1,153 @@
+"""
+Silence known template errors before pedant formats, logs or raises them.
+
+The ``PEDANT_ALLOWLIST`` setting lists rules of the form
+``(template glob, variable glob[, error kind])``:
+
+    PEDANT_ALLOWLIST = [
+        ('legacy/*', '*'),
+        ('*', 'request.user.profile.*', 'unknown_variable'),
+    ]
+
+``*`` and ``?`` match as in ``fnmatch``. Kinds are ``unknown_variable`` and
+``unicode_decode_error`` (all kinds if left out). Matching errors render as
+django would render them without pedant, and are only counted (see
+``suppressed_counts``).
+
+The rules are compiled once, and the rules matching each variable name are
+remembered, so checking an error is a dict lookup. Finding out which template
+is being rendered means walking the stack, so that is only done when one of
+the rules matching the variable is for specific templates.
+"""
+import re
+import threading
+
+from django.conf import settings
+
+from pedant.introspection import current_template_name
+
+# Bound on the number of remembered lookups.
+MAX_CACHED = 10000
+
+
+def _glob(pattern):
+    """
+    Translate a glob into a regular expression.
+
+    >>> bool(re.match(_glob('legacy/*.html'), 'legacy/a.html'))
+    True
+    """
+    return ''.join(
+        '.*' if char == '*' else '.' if char == '?' else re.escape(char)
+        for char in pattern) + r'\Z'
+
+
+class Allowlist(object):
+    """
+    Matcher for a list of (template glob, variable glob[, kind]) rules.
+    """
+    def __init__(self, rules):
+        self.rules = [tuple(rule) for rule in rules]
+        self.counts = [0] * len(self.rules)
+        self._compiled = [
+            (None if rule[0] == '*' else re.compile(_glob(rule[0]), re.S),
+             re.compile(_glob(rule[1]), re.S),
+             rule[2] if len(rule) > 2 else None)
+            for rule in self.rules]
+        self._candidates = {}
+        self._matches = {}
+        self._lock = threading.Lock()
+
+    def _remember(self, cache, key, value):
+        with self._lock:
+            if len(cache) >= MAX_CACHED:
+                cache.clear()
+            cache[key] = value
+        return value
+
+    def candidates(self, kind, variable):
+        """
+        Return the indexes of the rules for ``kind`` matching ``variable``.
+        """
+        key = (kind, variable)
+        try:
+            return self._candidates[key]
+        except KeyError:
+            return self._remember(self._candidates, key, tuple(
+                index for index, (_, variable_regex, rule_kind) in
+                enumerate(self._compiled)
+                if rule_kind in (None, kind) and
+                variable_regex.match(variable)))
+
+    def match(self, kind, variable, template_name):
+        """
+        Return the index of the first rule matching the error, or None.
+
+        ``template_name`` is called to get the template's name, but only if
+        a rule depends on it.
+        """
+        candidates = self.candidates(kind, variable)
+        if not candidates:
+            return None
+        if self._compiled[candidates[0]][0] is None:
+            return candidates[0]
+        template = template_name()
+        key = (kind, variable, template)
+        try:
+            return self._matches[key]
+        except KeyError:
+            pass
+        for index in candidates:
+            template_regex = self._compiled[index][0]
+            if template_regex is None or template_regex.match(template):
+                break
+        else:
+            index = None
+        return self._remember(self._matches, key, index)
+
+    def suppress(self, kind, variable, template_name=current_template_name):
+        """
+        Return whether the error is allowed, counting it if so.
+        """
+        index = self.match(kind, variable, template_name)
+        if index is None:
+            return False
+        self.counts[index] += 1
+        return True
+
+
+_allowlist = None
+
+
+def get_allowlist():
+    """
+    Return the Allowlist for the ``PEDANT_ALLOWLIST`` setting, or None.
+    """
+    global _allowlist
+    rules = getattr(settings, 'PEDANT_ALLOWLIST', None)
+    if not rules:
+        return None
+    if _allowlist is None or _allowlist[0] is not rules:
+        _allowlist = (rules, Allowlist(rules))
+    return _allowlist[1]
+
+
+def suppressed(kind, variable):
+    """
+    Return whether an error of ``kind`` for ``variable`` in the template
+    being rendered is allowed by ``PEDANT_ALLOWLIST``.
+    """
+    allowlist = get_allowlist()
+    if allowlist is None:
+        return False
+    return allowlist.suppress(kind, getattr(variable, 'var', variable))
+
+
+def suppressed_counts():
+    """
+    Return [(rule, number of errors suppressed)] for this process.
+    """
+    allowlist = get_allowlist()
+    if allowlist is None:
+        return []
+    return list(zip(allowlist.rules, allowlist.counts))
@@ -0,0 +1,119 @@
+"""
+Render one template with many contexts, pedantically, across processes.
+
+``render_many`` is for batch jobs like mass emails: the template is compiled
+once in the calling process, which then forks ``workers`` processes that
+inherit it and render the contexts in strict mode. Each context is rendered
+on its own, so a bad one only fails its own item:
+
+    for result in render_many('email.txt', contexts, workers=8):
+        if result.error is not None:
+            log.error('Could not render: %s', result.error)
+
+Contexts are sent to the workers by pickling, so they should be plain data.
+"""
+import multiprocessing
+import traceback
+from collections import namedtuple
+
+import django
+from django.db import connections
+from django.template.base import Context
+from django.template.loader import get_template
+from django.utils.encoding import force_text
+
+from pedant.decorators import PedanticTemplateRenderingError
+from pedant.decorators import strict_rendering
+
+DEFAULT_CHUNKSIZE = 100
+
+RenderResult = namedtuple('RenderResult', 'output error')
+
+# The template being rendered, in a worker process.
+_template = None
+
+
+def _compile(template_name):
+    template = get_template(template_name)
+    if django.VERSION >= (1, 8):
+        # The backend's template; render the django Template directly.
+        template = template.template
+    return template
+
+
+def _text(e):
+    try:
+        return force_text(e, errors='replace')
+    except Exception:
+        return repr(e)
+
+
+def _error(e):
+    """
+    Return a PedanticTemplateRenderingError describing ``e``, which can travel
+    back to the parent process: not every exception unpickles (e.g.
+    VariableDoesNotExist), and one that doesn't stops the pool.
+    """
+    if isinstance(e, PedanticTemplateRenderingError):
+        message = _text(e)
+    else:
+        message = u'%s: %s' % (e.__class__.__name__, _text(e))
+    error = PedanticTemplateRenderingError(message)
+    error.traceback = traceback.format_exc()
+    return error
+
+
+def _render(context):
+    try:
+        return RenderResult(_template.render(Context(context)), None)
+    except Exception as e:
+        return RenderResult(None, _error(e))
+
+
+def _render_in_process(template, context):
+    with strict_rendering():
+        try:
+            return RenderResult(template.render(Context(context)), None)
+        except Exception as e:
+            return RenderResult(None, e)
+
+
+def _start_worker(template):
+    global _template
+    _template = template
+    # Workers exit when the batch is done, so this is never undone.
+    strict_rendering().__enter__()
+
+
+def render_many(template_name, contexts, workers=None,
+                chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Render ``template_name`` with each dict in ``contexts`` in strict mode.
+
+    Yields a RenderResult(output, error) per context, in order, as they are
+    rendered; ``error`` is the exception that rendering raised, or None.
+    ``workers`` defaults to the number of CPUs; with ``workers=1`` everything
+    renders in this process. Errors from workers are
+    PedanticTemplateRenderingErrors with the original's class name and
+    message, and its formatted traceback in ``traceback``.
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    template = _compile(template_name)
+    if workers == 1:
+        for context in contexts:
+            yield _render_in_process(template, context)
+        return
+    # Forked workers must not share the parent's database connections
+    # (but closing one would break an open transaction).
+    for connection in connections.all():
+        if not connection.in_atomic_block:
+            connection.close()
+    pool = multiprocessing.Pool(
+        workers, initializer=_start_worker, initargs=(template,))
+    try:
+        for result in pool.imap(_render, contexts, chunksize):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,167 @@
+"""
+Catch templates that get slower, by rendering them against fixed contexts.
+
+The ``PEDANT_BENCHMARKS`` setting maps template names to the contexts to
+render them with. A context is a dict, a callable returning one (for contexts
+that need the database), or the path of a JSON file holding one, e.g. a
+context recorded from a real request. A list of contexts is rendered in turn.
+
+    PEDANT_BENCHMARKS = {
+        'orders/list.html': 'benchmarks/orders.json',
+        'sidebar.html': [{'user': None}, make_sidebar_context],
+    }
+
+Templates are loaded with the configured template loaders (or compiled from
+the file, for an absolute path) and rendered in strict mode, so a benchmark
+also fails on template errors. ``./manage.py pedant_benchmark --save``
+records the median and percentiles per template in a baseline file; later
+runs fail when a template's median is more than
+``PEDANT_BENCHMARK_THRESHOLD`` times (1.25 by default) its baseline.
+"""
+import io
+import json
+import os
+from timeit import default_timer
+
+from django.conf import settings
+from django.template.base import Context
+from django.template.base import Template
+from django.template.loader import get_template
+
+from pedant.decorators import strict_rendering
+
+DEFAULT_BASELINE_FILE = '.pedant-benchmarks.json'
+DEFAULT_ROUNDS = 100
+DEFAULT_THRESHOLD = 1.25
+
+
+def percentile(times, percent):
+    """
+    Return the nearest-rank ``percent`` percentile of sorted ``times``.
+
+    >>> percentile([1, 2, 3, 4], 50)
+    2
+    >>> percentile([1, 2, 3, 4], 90)
+    4
+    """
+    rank = -(-len(times) * percent // 100)
+    return times[max(int(rank), 1) - 1]
+
+
+def statistics(times):
+    times = sorted(times)
+    return {
+        'rounds': len(times),
+        'median': percentile(times, 50),
+        'p90': percentile(times, 90),
+        'p99': percentile(times, 99),
+    }
+
+
+def load_template(name):
+    """
+    Load the named template with the template loaders, or compile the
+    template file at an absolute path.
+    """
+    if os.path.isabs(name):
+        with io.open(name, encoding=settings.FILE_CHARSET) as f:
+            return Template(f.read(), name=name)
+    template = get_template(name)
+    # The backend's template, from django 1.8.
+    return getattr(template, 'template', template)
+
+
+def load_contexts(spec):
+    """
+    Return the list of context dicts described by a ``PEDANT_BENCHMARKS``
+    value.
+    """
+    if isinstance(spec, (list, tuple)):
+        return [context for item in spec for context in load_contexts(item)]
+    if callable(spec):
+        return [spec()]
+    if isinstance(spec, dict):
+        return [spec]
+    with io.open(spec, encoding='utf-8') as f:
+        return [json.load(f)]
+
+
+def time_renders(template, contexts, rounds=DEFAULT_ROUNDS):
+    """
+    Render ``template`` with each context ``rounds`` times, returning the
+    time each render took.
+    """
+    # Strict mode is entered once, so installing it isn't part of the times.
+    with strict_rendering():
+        # Render once first, so one-time costs (and errors) don't skew the
+        # times.
+        for context in contexts:
+            template.render(Context(context))
+        times = []
+        for _ in range(rounds):
+            for context in contexts:
+                context = Context(context)
+                start = default_timer()
+                template.render(context)
+                times.append(default_timer() - start)
+    return times
+
+
+def run(benchmarks=None, rounds=None):
+    """
+    Return {template name: statistics} for the configured benchmarks.
+    """
+    if benchmarks is None:
+        benchmarks = getattr(settings, 'PEDANT_BENCHMARKS', {})
+    if rounds is None:
+        rounds = getattr(settings, 'PEDANT_BENCHMARK_ROUNDS', DEFAULT_ROUNDS)
+    return dict(
+        (name, statistics(time_renders(
+            load_template(name), load_contexts(spec), rounds)))
+        for name, spec in benchmarks.items())
+
+
+def load_baseline(path=DEFAULT_BASELINE_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(results, path=DEFAULT_BASELINE_FILE):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def regressions(results, baseline, threshold=None):
+    """
+    Return (name, baseline median, median) for templates whose median render
+    time grew by more than ``threshold`` times.
+    """
+    if threshold is None:
+        threshold = getattr(
+            settings, 'PEDANT_BENCHMARK_THRESHOLD', DEFAULT_THRESHOLD)
+    slower = []
+    for name, stats in sorted(results.items()):
+        if name in baseline and (
+                stats['median'] > baseline[name]['median'] * threshold):
+            slower.append((name, baseline[name]['median'], stats['median']))
+    return slower
+
+
+def report(results, baseline):
+    """
+    Return a text table of the results, in milliseconds.
+    """
+    rows = [('Template', 'Median', 'p90', 'p99', 'Baseline')]
+    for name, stats in sorted(results.items()):
+        previous = baseline.get(name)
+        rows.append((name,) + tuple(
+            '%.3f' % (stats[key] * 1000) for key in ('median', 'p90', 'p99')
+        ) + ('%.3f' % (previous['median'] * 1000) if previous else '-',))
+    widths = [max(len(row[i]) for row in rows) for i in range(5)]
+    return '\n'.join(
+        '  '.join([row[0].ljust(widths[0])] +
+                  [cell.rjust(width)
+                   for cell, width in zip(row[1:], widths[1:])])
+        for row in rows) + '\n'
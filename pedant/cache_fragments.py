@@ -0,0 +1,156 @@
+"""
+Check that ``{% cache %}`` fragments vary on everything they depend on.
+
+A fragment cached with ``{% cache 600 sidebar %}`` that renders ``{{ user }}``
+will serve one user's sidebar to everybody. Both checks here compare the
+context variables used inside a fragment with the fragment's vary-on
+arguments (by their first lookup, so varying on ``user.pk`` covers
+``{{ user.name }}``):
+
+- ``check_fragments`` does it statically, for ``pedant_check``.
+- ``fragment_checking`` does it each time a fragment renders, which also
+  catches variables used by the templates it includes, and only reports
+  variables the context defines. It is part of pedant's strict and log modes,
+  and only adds work to ``{% cache %}`` tags.
+
+Names in the ``PEDANT_CACHE_VARY_ON_IGNORE`` setting (e.g. ``STATIC_URL``)
+are never reported.
+"""
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.base import Node
+from django.template.base import TemplateSyntaxError
+from django.template.base import Variable
+from django.template.base import VariableDoesNotExist
+from django.template.loader_tags import IncludeNode
+from django.utils import six
+
+from pedant.includes import get_template
+from pedant.introspection import bound_names
+from pedant.introspection import current_template_name
+from pedant.introspection import node_lineno
+from pedant.introspection import variable_names
+from pedant.patching import patch_object
+
+
+def _ignored():
+    return set(getattr(settings, 'PEDANT_CACHE_VARY_ON_IGNORE', ()))
+
+
+def _vary_on_names(cache_node):
+    names = set()
+    for expression in cache_node.vary_on:
+        if isinstance(expression.var, Variable) and expression.var.lookups:
+            names.add(expression.var.lookups[0])
+    return names
+
+
+def mismatch_message(cache_node, name, template_name):
+    return (
+        "{%% cache %%} fragment '%s' at %s:%s uses '%s', which is not one of "
+        'its vary-on arguments' % (
+            cache_node.fragment_name, template_name,
+            node_lineno(cache_node), name))
+
+
+def check_fragments(template, template_name):
+    """
+    Return (line, message) for variables cache fragments don't vary on.
+    """
+    # Imported here, as it imports django's cache framework.
+    from django.templatetags.cache import CacheNode
+    problems = []
+    ignored = _ignored()
+    for cache_node in template.nodelist.get_nodes_by_type(CacheNode):
+        nodes = cache_node.nodelist.get_nodes_by_type(Node)
+        allowed = _vary_on_names(cache_node) | ignored
+        for node in nodes:
+            allowed |= bound_names(node)
+        reported = set()
+        for node in nodes:
+            for name in sorted(variable_names(node) - allowed - reported):
+                reported.add(name)
+                problems.append((
+                    node_lineno(node),
+                    mismatch_message(cache_node, name, template_name)))
+    return problems
+
+
+def _included_template(node, context):
+    """
+    Return the template an include node would render, or None if that
+    can't be known without rendering it.
+    """
+    if node.isolated_context or node.template.filters:
+        return None
+    var = node.template.var
+    try:
+        template = var.resolve(context) if isinstance(var, Variable) else var
+    except VariableDoesNotExist:
+        return None
+    if isinstance(template, six.string_types):
+        try:
+            template = get_template(context, template)
+        except (TemplateDoesNotExist, TemplateSyntaxError):
+            return None
+    # The backend's template, from django 1.8.
+    template = getattr(template, 'template', template)
+    return template if hasattr(template, 'nodelist') else None
+
+
+def fragment_names(cache_node, context):
+    """
+    Return the names a fragment, and the templates it includes, look up but
+    don't set themselves.
+    """
+    nodes = getattr(cache_node, '_pedant_nodes', None)
+    if nodes is None:
+        nodes = cache_node._pedant_nodes = (
+            cache_node.nodelist.get_nodes_by_type(Node))
+    nodes = list(nodes)
+    seen = set()
+    for node in nodes:
+        if isinstance(node, IncludeNode):
+            template = _included_template(node, context)
+            if template is not None and id(template) not in seen:
+                seen.add(id(template))
+                nodes.extend(template.nodelist.get_nodes_by_type(Node))
+    used = set()
+    bound = set()
+    for node in nodes:
+        used |= variable_names(node)
+        bound |= bound_names(node)
+    return used - bound
+
+
+class fragment_checking(object):
+    """
+    Context manager that calls ``on_mismatch(message)`` when a cache fragment
+    that is rendered uses a variable, defined outside it, that it does not
+    vary on.
+    """
+    def __init__(self, on_mismatch):
+        self.on_mismatch = on_mismatch
+        self._patches = []
+
+    def __enter__(self):
+        # Imported here, as it imports django's cache framework.
+        from django.templatetags.cache import CacheNode
+        original_render = CacheNode.render
+        on_mismatch = self.on_mismatch
+
+        def render(self, context):
+            allowed = _vary_on_names(self) | _ignored()
+            for name in sorted(fragment_names(self, context) - allowed):
+                if name in context:
+                    on_mismatch(mismatch_message(
+                        self, name, current_template_name()))
+            return original_render(self, context)
+
+        patches = patch_object(CacheNode, 'render', render)
+        patches.__enter__()
+        self._patches.append(patches)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._patches.pop().__exit__(*exc_info)
@@ -0,0 +1,260 @@
+"""
+Static checks over a project's template files, run by ``pedant_check``.
+
+Every template under the configured template directories (including those of
+installed apps) is compiled and passed to each function in ``CHECKS``, which
+returns (line, message) pairs for the problems it finds. Templates are also
+checked for ``{% extends %}``/``{% include %}`` of templates that don't exist.
+
+``TemplateWatcher`` keeps the compiled templates and the graph of which
+templates extend or include which, so that after an edit only the changed
+templates and those depending on them are checked again
+(``pedant_check --watch``).
+"""
+import os
+from collections import namedtuple
+
+import django
+from django.conf import settings
+from django.template.base import Template
+from django.template.base import TemplateSyntaxError
+from django.template.loader_tags import ExtendsNode
+from django.template.loader_tags import IncludeNode
+from django.utils import six
+
+from pedant.cache_fragments import check_fragments
+from pedant.introspection import node_lineno
+
+CHECKS = [check_fragments]
+
+
+class Problem(namedtuple('Problem', 'template line message')):
+    def __str__(self):
+        return '%s:%s: %s' % (self.template, self.line or '?', self.message)
+
+
+def template_directories():
+    """
+    Return the directories the project's templates are loaded from.
+    """
+    if django.VERSION < (1, 8):
+        from django.template.loaders.app_directories import app_template_dirs
+        return list(settings.TEMPLATE_DIRS) + list(app_template_dirs)
+
+    from django.template import engines
+    from django.template.backends.django import DjangoTemplates
+    from django.template.utils import get_app_template_dirs
+    directories = []
+    for engine in engines.all():
+        if isinstance(engine, DjangoTemplates):
+            directories.extend(engine.engine.dirs)
+            if engine.engine.app_dirs:
+                directories.extend(get_app_template_dirs('templates'))
+    # Keep the first occurrence of each, in loader order.
+    seen = set()
+    return [directory for directory in directories
+            if not (directory in seen or seen.add(directory))]
+
+
+def find_templates(directories=None):
+    """
+    Return the paths of all files under the template directories.
+    """
+    if directories is None:
+        directories = template_directories()
+    paths = []
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            paths.extend(os.path.join(root, name) for name in sorted(files))
+    return paths
+
+
+def template_names(directories=None):
+    """
+    Return {template name: path} for the files under the template
+    directories. Earlier directories shadow later ones, as in the loaders.
+    """
+    if directories is None:
+        directories = template_directories()
+    names = {}
+    for directory in directories:
+        for path in find_templates([directory]):
+            names.setdefault(os.path.relpath(path, directory), path)
+    return names
+
+
+def compile_template(path):
+    with open(path, 'rb') as f:
+        source = f.read().decode(settings.FILE_CHARSET)
+    return Template(source, name=path)
+
+
+def constant_name(expression):
+    """
+    Return the template name an ``{% extends %}``/``{% include %}``
+    expression always resolves to, or None if it depends on the context.
+    """
+    name = getattr(expression, 'var', None)
+    if isinstance(name, six.string_types) and not expression.filters:
+        return name
+    return None
+
+
+def dependencies(template):
+    """
+    Return [(line, tag, template name)] for the templates that ``template``
+    extends or includes by a constant name.
+    """
+    result = []
+    for node_type, tag, attribute in ((ExtendsNode, 'extends', 'parent_name'),
+                                      (IncludeNode, 'include', 'template')):
+        for node in template.nodelist.get_nodes_by_type(node_type):
+            name = constant_name(getattr(node, attribute))
+            if name is not None:
+                result.append((node_lineno(node), tag, name))
+    return result
+
+
+def _problems(path, template, exists):
+    """
+    Return the Problems found in compiled ``template``. ``exists(name)`` says
+    whether a template name can be loaded.
+    """
+    problems = [Problem(path, line, message)
+                for check in CHECKS
+                for line, message in check(template, path)]
+    problems.extend(
+        Problem(path, line, "%s '%s', which is not in the template "
+                            "directories" % (tag, name))
+        for line, tag, name in dependencies(template) if not exists(name))
+    return problems
+
+
+def _compile_problem(path, e):
+    return Problem(path, None, 'does not compile: %s' % e)
+
+
+def check_template(path, names=None):
+    """
+    Return the list of Problems found in the template at ``path``.
+    """
+    try:
+        template = compile_template(path)
+    except (TemplateSyntaxError, UnicodeDecodeError) as e:
+        return [_compile_problem(path, e)]
+    if names is None:
+        names = template_names()
+    return _problems(path, template, names.__contains__)
+
+
+def check_all(paths=None):
+    names = template_names()
+    if paths is None:
+        paths = find_templates()
+    return [problem for path in paths
+            for problem in check_template(path, names)]
+
+
+class TemplateWatcher(object):
+    """
+    Incrementally checks the templates under ``directories``.
+
+    Each ``poll()`` looks at the files' modification times, recompiles those
+    that changed, and checks them along with every template that extends or
+    includes them, directly or not. Other templates are neither read nor
+    checked again.
+    """
+    def __init__(self, directories=None):
+        if directories is None:
+            directories = template_directories()
+        self.directories = directories
+        self.mtimes = {}
+        self.names = {}
+        # path -> compiled Template, or None if it doesn't compile.
+        self.templates = {}
+        self.compile_problems = {}
+        # path -> names it depends on, and name -> paths depending on it.
+        self.dependencies = {}
+        self.dependents = {}
+        self.problems = {}
+
+    def _scan(self):
+        mtimes = {}
+        for path in find_templates(self.directories):
+            try:
+                stat = os.stat(path)
+                mtimes[path] = (stat.st_mtime, stat.st_size)
+            except OSError:
+                pass  # Removed while scanning.
+        return mtimes
+
+    def _set_dependencies(self, path, names):
+        for name in self.dependencies.pop(path, ()):
+            self.dependents[name].discard(path)
+        if names:
+            self.dependencies[path] = names
+            for name in names:
+                self.dependents.setdefault(name, set()).add(path)
+
+    def _compile(self, path):
+        try:
+            template = compile_template(path)
+        except (TemplateSyntaxError, UnicodeDecodeError) as e:
+            self.templates[path] = None
+            self.compile_problems[path] = _compile_problem(path, e)
+            self._set_dependencies(path, set())
+        else:
+            self.templates[path] = template
+            self._set_dependencies(path, set(
+                name for _, _, name in dependencies(template)))
+
+    def _remove(self, path):
+        self.templates.pop(path, None)
+        self.compile_problems.pop(path, None)
+        self.problems.pop(path, None)
+        self._set_dependencies(path, set())
+
+    def _check(self, path):
+        template = self.templates[path]
+        if template is None:
+            return [self.compile_problems[path]]
+        return _problems(path, template, self.names.__contains__)
+
+    def poll(self):
+        """
+        Check what changed since the last poll (everything, the first time).
+
+        Returns {path: [Problem]} for the templates that were checked.
+        """
+        mtimes = self._scan()
+        changed = set(path for path, mtime in mtimes.items()
+                      if self.mtimes.get(path) != mtime)
+        removed = set(self.mtimes) - set(mtimes)
+        self.mtimes = mtimes
+        if not changed and not removed:
+            return {}
+
+        names = template_names(self.directories)
+        # Names whose template changed, appeared, disappeared or moved.
+        affected_names = set(
+            name for name in set(names) | set(self.names)
+            if names.get(name) != self.names.get(name) or
+            names[name] in changed)
+        self.names = names
+        for path in removed:
+            self._remove(path)
+        for path in changed:
+            self._compile(path)
+
+        checked = set(changed)
+        pending = list(affected_names)
+        paths_names = dict((path, name) for name, path in names.items())
+        while pending:
+            for path in self.dependents.get(pending.pop(), ()):
+                if path not in checked:
+                    checked.add(path)
+                    if path in paths_names:
+                        pending.append(paths_names[path])
+        for path in checked:
+            self.problems[path] = self._check(path)
+        return dict((path, self.problems[path]) for path in checked)
@@ -0,0 +1,220 @@
+"""
+Rank templates by what they should cost to render, from their structure.
+
+``pedant_cost`` compiles every template under the template directories and
+adds up, without rendering anything:
+
+- ``node`` for each node, ``lookup`` for each part of each variable
+  (``order.customer.name`` is three) and ``filter`` for each filter,
+- everything inside ``{% for %}`` ``loop_iterations`` times per level of
+  nesting,
+- for ``{% include %}`` of a constant name, ``include`` plus the cost of the
+  included template,
+- for ``{% extends %}``, the parent template with the blocks the child
+  overrides replaced, plus ``block`` for each block,
+- only the most expensive branch of ``{% if %}``/``{% ifdef %}``.
+
+The weights are in ``COST_WEIGHTS``, overridden by the
+``PEDANT_COST_WEIGHTS`` setting. If there is a ``pedant_benchmark`` baseline,
+the cost is converted to milliseconds with the ratio that best fits the
+templates benchmarked, to predict the render time of the others.
+"""
+from django.conf import settings
+from django.template.base import TemplateSyntaxError
+from django.template.base import Variable
+from django.template.defaulttags import ForNode
+from django.template.loader_tags import BlockNode
+from django.template.loader_tags import ExtendsNode
+from django.template.loader_tags import IncludeNode
+
+from pedant.checker import compile_template
+from pedant.checker import constant_name
+from pedant.checker import template_names
+from pedant.introspection import expressions
+
+COST_WEIGHTS = {
+    'node': 1.0,
+    'lookup': 1.0,
+    'filter': 2.0,
+    'include': 20.0,
+    'block': 3.0,
+    'loop_iterations': 10.0,
+}
+
+
+class Estimate(object):
+    """
+    The estimated cost of a template, and what it comes from.
+    """
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.cost = 0.0
+        self.loop_depth = 0
+        self.loop_includes = 0
+        self.loop_lookups = 0
+        self.filters = 0
+        # Cost of the nodes outside blocks, and of each block's own nodes.
+        self.outside = 0.0
+        self.blocks = {}
+
+    def add_counts(self, other, depth=0):
+        """
+        Add the counts of a template included at loop depth ``depth``.
+        """
+        self.loop_depth = max(self.loop_depth, depth + other.loop_depth)
+        self.loop_includes += other.loop_includes
+        self.loop_lookups += other.loop_lookups
+        self.filters += other.filters
+
+
+class Estimator(object):
+    """
+    Estimates the cost of the templates in ``names`` ({name: path}).
+    """
+    def __init__(self, names, weights=None):
+        self.names = names
+        self.weights = dict(COST_WEIGHTS)
+        self.weights.update(
+            weights or getattr(settings, 'PEDANT_COST_WEIGHTS', {}))
+        self.estimates = {}
+        self._in_progress = set()
+
+    def estimate(self, name):
+        """
+        Return the Estimate for template ``name``, or None if it doesn't exist,
+        doesn't compile or (indirectly) includes itself.
+        """
+        if name in self.estimates:
+            return self.estimates[name]
+        if name not in self.names or name in self._in_progress:
+            return None
+        self._in_progress.add(name)
+        try:
+            template = compile_template(self.names[name])
+        except (TemplateSyntaxError, UnicodeDecodeError):
+            estimate = None
+        else:
+            estimate = self._estimate_template(name, template)
+        finally:
+            self._in_progress.discard(name)
+        self.estimates[name] = estimate
+        return estimate
+
+    def _estimate_template(self, name, template):
+        estimate = Estimate(name, self.names[name])
+        estimate.outside = self._nodelist(template.nodelist, 0, estimate)
+        extends = [node for node in template.nodelist
+                   if isinstance(node, ExtendsNode)]
+        parent = extends and self.estimate(
+            constant_name(extends[0].parent_name))
+        if parent:
+            blocks = dict(parent.blocks)
+            blocks.update(estimate.blocks)
+            estimate.blocks = blocks
+            estimate.outside = parent.outside
+            estimate.add_counts(parent)
+        estimate.cost = estimate.outside + sum(estimate.blocks.values())
+        return estimate
+
+    def _nodelist(self, nodelist, depth, estimate):
+        return sum(self._node(node, depth, estimate) for node in nodelist)
+
+    def _node(self, node, depth, estimate):
+        weights = self.weights
+        repeat = weights['loop_iterations'] ** depth
+        cost = weights['node']
+        for expression in expressions(node):
+            var = expression.var
+            lookups = (len(var.lookups) if isinstance(var, Variable) and
+                       var.lookups else 0)
+            cost += (lookups * weights['lookup'] +
+                     len(expression.filters) * weights['filter'])
+            estimate.filters += len(expression.filters)
+            if depth:
+                estimate.loop_lookups += max(lookups - 1, 0)
+        cost *= repeat
+
+        if isinstance(node, IncludeNode):
+            included = self.estimate(constant_name(node.template))
+            cost += repeat * (weights['include'] +
+                              (included.cost if included else 0))
+            if depth:
+                estimate.loop_includes += 1
+            if included:
+                estimate.add_counts(included, depth)
+        elif isinstance(node, ForNode):
+            estimate.loop_depth = max(estimate.loop_depth, depth + 1)
+            cost += self._nodelist(node.nodelist_loop, depth + 1, estimate)
+            cost += self._nodelist(node.nodelist_empty, depth, estimate)
+        elif isinstance(node, BlockNode):
+            # Counted once the template's blocks are known, see above.
+            estimate.blocks[node.name] = self._nodelist(
+                node.nodelist, depth, estimate)
+            cost += repeat * weights['block']
+        elif hasattr(node, 'conditions_nodelists'):
+            cost += max([0] + [
+                self._nodelist(nodelist, depth, estimate)
+                for _, nodelist in node.conditions_nodelists])
+        else:
+            for attribute in node.child_nodelists:
+                cost += self._nodelist(
+                    getattr(node, attribute, None) or [], depth, estimate)
+        return cost
+
+
+def estimate_all(directories=None, weights=None):
+    """
+    Return the Estimates of all templates, most expensive first.
+    """
+    estimator = Estimator(template_names(directories), weights)
+    estimates = [estimator.estimate(name) for name in sorted(estimator.names)]
+    return sorted([estimate for estimate in estimates if estimate],
+                  key=lambda estimate: (-estimate.cost, estimate.name))
+
+
+def calibrate(estimates, baseline):
+    """
+    Return the seconds per unit of cost that best fit the median render times
+    of a benchmark baseline, or None if no template was benchmarked.
+    """
+    pairs = [(estimate.cost, baseline[estimate.name]['median'])
+             for estimate in estimates
+             if estimate.name in baseline and estimate.cost]
+    if not pairs:
+        return None
+    return (sum(cost * seconds for cost, seconds in pairs) /
+            sum(cost * cost for cost, _ in pairs))
+
+
+def report(estimates, baseline=None, scale=None):
+    """
+    Return a text table of the estimates, with the predicted and measured
+    milliseconds if there is a baseline. ``scale`` defaults to
+    ``calibrate(estimates, baseline)``.
+    """
+    baseline = baseline or {}
+    if scale is None:
+        scale = calibrate(estimates, baseline)
+    header = ('Template', 'Cost', 'Loop depth', 'Loop includes',
+              'Loop lookups', 'Filters', 'Blocks')
+    if scale is not None:
+        header += ('Predicted ms', 'Measured ms')
+    rows = [header]
+    for estimate in estimates:
+        row = (estimate.name, '%.0f' % estimate.cost) + tuple(
+            str(value) for value in (
+                estimate.loop_depth, estimate.loop_includes,
+                estimate.loop_lookups, estimate.filters,
+                len(estimate.blocks)))
+        if scale is not None:
+            measured = baseline.get(estimate.name)
+            row += ('%.3f' % (estimate.cost * scale * 1000),
+                    '%.3f' % (measured['median'] * 1000) if measured else '-')
+        rows.append(row)
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    return '\n'.join(
+        '  '.join([row[0].ljust(widths[0])] +
+                  [cell.rjust(width)
+                   for cell, width in zip(row[1:], widths[1:])])
+        for row in rows) + '\n'
@@ -12,19 +12,30 @@ from django.utils.html import escape
 from django.utils.safestring import EscapeData
 from django.utils.safestring import SafeData
 from django.utils.timezone import template_localtime
-from mock import patch
+
+from pedant import instrumentation
+from pedant import metrics
+from pedant import snapshots
+from pedant.allowlist import suppressed
+from pedant.cache_fragments import fragment_checking
+from pedant.includes import include_checking
+from pedant.introspection import current_template_name
+from pedant.patching import patch
+from pedant.patching import patch_object
+from pedant.patching import PatchSet
+from pedant.prescan import prescanning
 
 
 def patch_string_if_invalid(new):
     if django.VERSION < (1, 8):
-        return patch.object(
+        return patch_object(
             settings,
             'TEMPLATE_STRING_IF_INVALID',
             new,
         )
     else:
         from django.template import engines
-        return patch.object(
+        return patch_object(
             engines['django'].engine,
             'string_if_invalid',
             new,
@@ -43,6 +54,21 @@ class PedanticTemplateRenderingError(Exception):
     pass
 
 
+UNKNOWN_VARIABLE = 'unknown_variable'
+UNICODE_DECODE_ERROR = 'unicode_decode_error'
+
+
+def _record_error(kind, variable):
+    """
+    Count a template error in the host-wide metrics table, if enabled.
+    """
+    if metrics.get_table() is None:
+        # Don't walk the stack for the template name for nothing.
+        return
+    metrics.record_error(
+        kind, current_template_name(), getattr(variable, 'var', variable))
+
+
 # This strategy relies on http://djangosnippets.org/snippets/646/
 # and the behavior of invalid variables.
 # https://docs.djangoproject.com/en/dev/ref/templates/api/#invalid-template-variables  # nopep8
@@ -56,6 +82,9 @@ class FailInvalidVariableTemplate(object):
         When django tries to format the missing variable into the string, we
         instead raise an exception.
         """
+        if suppressed(UNKNOWN_VARIABLE, missing):
+            return ''
+        _record_error(UNKNOWN_VARIABLE, missing)
         message = 'Unknown template variable %r' % missing
         raise PedanticTemplateRenderingError(message)
 
@@ -85,9 +114,13 @@ class LogInvalidVariableTemplate(object):
         When django tries to format the missing variable into the string, we
         instead log the error.
         """
-        self.logger.log(
-            self.level,
-            'Unknown template variable %r', missing)
+        if not suppressed(UNKNOWN_VARIABLE, missing):
+            _record_error(UNKNOWN_VARIABLE, missing)
+            snapshots.record(
+                UNKNOWN_VARIABLE, 'Unknown template variable %r' % missing)
+            self.logger.log(
+                self.level,
+                'Unknown template variable %r', missing)
 
         if '%s' in self.template_string:
             return self.template_string % missing
@@ -97,6 +130,14 @@ class LogInvalidVariableTemplate(object):
         return search == '%s'
 
 
+class TimedLogInvalidVariableTemplate(LogInvalidVariableTemplate):
+    """
+    LogInvalidVariableTemplate whose formatting is timed by instrumentation.
+    """
+    __mod__ = instrumentation.timed(
+        'log_invalid_variable', LogInvalidVariableTemplate.__mod__)
+
+
 def _fail_template_string_if_invalid(f):
     return patch_string_if_invalid(FailInvalidVariableTemplate())(f)
 
@@ -112,11 +153,14 @@ def _log_template_string_if_invalid(logger, log_level=logging.ERROR):
 
     Will log missing variables at INFO.  The default log_level is ERROR.
     """
-    return patch_string_if_invalid(
-        LogInvalidVariableTemplate(logger, log_level))
+    if instrumentation.enabled():
+        template_class = TimedLogInvalidVariableTemplate
+    else:
+        template_class = LogInvalidVariableTemplate
+    return patch_string_if_invalid(template_class(logger, log_level))
 
 
-def _patch_invalid_var_format_string(f):
+def _patch_invalid_var_format_string():
     """
     Fix an issue with caching related to TEMPLATE_STRING_IF_INVALID.
 
@@ -129,8 +173,7 @@ def _patch_invalid_var_format_string(f):
 
     Note: This only affects version of Django below 1.8.
     """
-    patcher = patch('django.template.base.invalid_var_format_string', True)
-    return patcher(f)
+    return patch('django.template.base.invalid_var_format_string', True)
 
 
 __orig_resolve = FilterExpression.resolve
@@ -147,16 +190,10 @@ def strict_resolve(self, context, ignore_failures=False):
     return __orig_resolve(self, context, ignore_failures=False)
 
 
-def _always_strict_resolve(f):
-    return patch.object(FilterExpression, 'resolve', strict_resolve)(f)
-
-
-def __apply(arg, function):
-    return function(arg)
-
-
-def _compose(f1, f2):
-    return lambda arg: f1(f2(arg))
+def _always_strict_resolve():
+    return patch_object(
+        FilterExpression, 'resolve',
+        instrumentation.instrument('strict_resolve', strict_resolve))
 
 
 def debug_variable_node_render(self, context):
@@ -169,6 +206,11 @@ def debug_variable_node_render(self, context):
         output = localize(output, use_l10n=context.use_l10n)
         output = force_text(output)
     except Exception as e:
+        if isinstance(e, UnicodeDecodeError):
+            if suppressed(UNICODE_DECODE_ERROR,
+                          self.filter_expression.token):
+                return ''
+            _record_error(UNICODE_DECODE_ERROR, self.filter_expression.token)
         if not hasattr(e, 'django_template_source'):
             e.django_template_source = self.source
         raise
@@ -182,11 +224,17 @@ def variable_node_render(self, context):
     """
     Like VariableNode.render, but doesn't catch UnicodeDecodeError.
     """
-    output = self.filter_expression.resolve(context)
-    return render_value_in_context(output, context)
+    try:
+        output = self.filter_expression.resolve(context)
+        return render_value_in_context(output, context)
+    except UnicodeDecodeError:
+        if suppressed(UNICODE_DECODE_ERROR, self.filter_expression.token):
+            return ''
+        _record_error(UNICODE_DECODE_ERROR, self.filter_expression.token)
+        raise
 
 
-def _disallow_catching_UnicodeDecodeError(f):
+def _disallow_catching_UnicodeDecodeError():
     """
     Patches a template modules to prevent catching UnicodeDecodeError.
 
@@ -194,14 +242,15 @@ def _disallow_catching_UnicodeDecodeError(f):
     UnicodeDecodeError instead of a TemplateEncodingError if the template
     string is not UTF-8 or unicode.
     """
-    patch_base = patch.object(VariableNode, 'render', variable_node_render)
-    patch_all = patch_base
+    patches = [patch_object(
+        VariableNode, 'render', instrumentation.instrument(
+            'variable_node_render', variable_node_render))]
     if django.VERSION < (1, 9):
         from django.template.debug import DebugVariableNode
-        patch_debug = patch.object(
-            DebugVariableNode, 'render', debug_variable_node_render)
-        patch_all = _compose(patch_all, patch_debug)
-    return patch_all(f)
+        patches.append(patch_object(
+            DebugVariableNode, 'render', instrumentation.instrument(
+                'variable_node_render', debug_variable_node_render)))
+    return PatchSet(patches)
 
 
 def _log_unicode_errors(logger, log_level):
@@ -211,7 +260,8 @@ def _log_unicode_errors(logger, log_level):
     def log_debug_render(*args, **kwargs):
         try:
             return debug_variable_node_render(*args, **kwargs)
-        except UnicodeDecodeError:
+        except UnicodeDecodeError as e:
+            snapshots.record(UNICODE_DECODE_ERROR, str(e))
             logger.log(
                 log_level,
                 "UnicodeDecodeError in template rendering",
@@ -221,37 +271,89 @@ def _log_unicode_errors(logger, log_level):
     def log_render(*args, **kwargs):
         try:
             return variable_node_render(*args, **kwargs)
-        except UnicodeDecodeError:
+        except UnicodeDecodeError as e:
+            snapshots.record(UNICODE_DECODE_ERROR, str(e))
             logger.log(
                 log_level,
                 "UnicodeDecodeError in template rendering",
                 exc_info=True)
         return ''
 
-    patch_base = patch.object(VariableNode, 'render', log_render)
-    patch_all = patch_base
+    patches = [patch_object(
+        VariableNode, 'render',
+        instrumentation.instrument('variable_node_render', log_render))]
     if django.VERSION < (1, 9):
         from django.template.debug import DebugVariableNode
-        patch_debug = patch.object(DebugVariableNode, 'render',
-                                   log_debug_render)
-        patch_all = _compose(patch_all, patch_debug)
-    return lambda f: patch_all(f)
+        patches.append(patch_object(
+            DebugVariableNode, 'render',
+            instrumentation.instrument('variable_node_render',
+                                       log_debug_render)))
+    return PatchSet(patches)
 
 
-@decorator
-def fail_on_template_errors(f, *args, **kwargs):
+def _raise_error(message):
+    raise PedanticTemplateRenderingError(message)
+
+
+def _raise_undecodable(messages):
+    raise PedanticTemplateRenderingError('; '.join(messages))
+
+
+def strict_rendering():
     """
-    Decorator that causes templates to fail on template errors.
+    Context manager that causes templates to fail on template errors.
+
+    with strict_rendering():
+        render_to_string('foo.html')
     """
-    decorators = [
-        _fail_template_string_if_invalid,
-        _always_strict_resolve,
-        _disallow_catching_UnicodeDecodeError,
+    patches = [
+        patch_string_if_invalid(FailInvalidVariableTemplate()),
+        _always_strict_resolve(),
+        _disallow_catching_UnicodeDecodeError(),
     ]
     if django.VERSION < (1, 8):
-        decorators.append(_patch_invalid_var_format_string)
+        patches.append(_patch_invalid_var_format_string())
+    patches.append(fragment_checking(_raise_error))
+    patches.append(include_checking(_raise_error, propagate=True))
+    patches.append(prescanning(_raise_undecodable))
+    return PatchSet(patches)
 
-    return reduce(__apply, decorators, f)(*args, **kwargs)
+
+def logged_rendering(logger, log_level=logging.ERROR):
+    """
+    Context manager that logs template errors to the specified logger.
+    """
+    if not (isinstance(log_level, int) and
+            log_level in logging._levelNames):
+        raise ValueError('Invalid log level %s' % log_level)
+
+    patches = [
+        snapshots.flushing(),
+        _log_template_string_if_invalid(logger, log_level),
+        _log_unicode_errors(logger, log_level),
+        _always_strict_resolve(),
+    ]
+    if django.VERSION < (1, 8):
+        patches.append(_patch_invalid_var_format_string())
+    patches.append(fragment_checking(
+        lambda message: logger.log(log_level, message)))
+    patches.append(include_checking(
+        lambda message: logger.log(log_level, message)))
+
+    def log_undecodable(messages):
+        for message in messages:
+            logger.log(log_level, message)
+    patches.append(prescanning(log_undecodable))
+    return PatchSet(patches)
+
+
+@decorator
+def fail_on_template_errors(f, *args, **kwargs):
+    """
+    Decorator that causes templates to fail on template errors.
+    """
+    with strict_rendering():
+        return f(*args, **kwargs)
 
 
 def log_template_errors(logger, log_level=logging.ERROR):
@@ -264,20 +366,11 @@ def log_template_errors(logger, log_level=logging.ERROR):
 
     Will log template errors at INFO.  The default log level is ERROR.
     """
-    if not (isinstance(log_level, int) and
-            log_level in logging._levelNames):
-        raise ValueError('Invalid log level %s' % log_level)
-
-    decorators = [
-        _log_template_string_if_invalid(logger, log_level),
-        _log_unicode_errors(logger, log_level),
-        _always_strict_resolve,
-    ]
-    if django.VERSION < (1, 8):
-        decorators.append(_patch_invalid_var_format_string)
+    patches = logged_rendering(logger, log_level)
 
     @decorator
     def function(f, *args, **kwargs):
-        return reduce(__apply, decorators, f)(*args, **kwargs)
+        with patches:
+            return f(*args, **kwargs)
 
     return function
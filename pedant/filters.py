@@ -0,0 +1,335 @@
+"""
+Find template filters that fail silently, and what filters cost.
+
+Builtin filters like ``date``, ``floatformat`` and ``add`` catch their own
+errors and return ``''``, so strict rendering never sees them fail. While
+``filter_instrumentation`` is active, calls that return an empty value
+(``''``/None) for a non-empty input are reported, naming the exception the
+filter caught to produce it:
+
+    Filter 'date' swallowed AttributeError for 'soon' in cart.html
+    Filter 'slugify' returned an empty value for '!' in cart.html
+
+Filters in ``PEDANT_FILTER_EMPTY_OK`` (``EMPTY_OK`` by default) return
+``''`` by design and are never reported.
+
+Calls and time are counted per filter and per (template, filter) in a
+FilterStats, by default the process-wide ``stats``.
+
+The filters of the template libraries are wrapped in place, once, by
+``install()``, which ``filter_instrumentation`` calls; outside
+instrumentation the wrappers only call the filter. Filters are looked up when
+a template is compiled, so to instrument templates compiled before the first
+instrumented render (e.g. by the cached loader), call ``install()`` at
+startup.
+
+The exception is found by calling the filter again with a trace function,
+only for the calls reported. So that no filter with side effects runs twice,
+this is only done for the filters in ``PEDANT_FILTER_PURE`` (``PURE`` by
+default: builtin filters that catch their errors and have no side effects);
+other filters' empty results are reported without naming the exception. The
+exception isn't named when another trace function (coverage.py, a debugger)
+is active either.
+"""
+import logging
+import sys
+import threading
+from timeit import default_timer
+
+import django
+from decorator import decorator
+from django.conf import settings
+from django.template.base import Template
+from django.utils import six
+
+from pedant.decorators import PedanticTemplateRenderingError
+from pedant.introspection import template_name
+from pedant.patching import patch_object
+from pedant.patching import SharedPatch
+
+EMPTY_OK = ('cut', 'default', 'default_if_none', 'pluralize', 'removetags',
+            'slice', 'striptags', 'yesno')
+PURE = ('date', 'dictsort', 'dictsortreversed', 'first', 'floatformat',
+        'last', 'time', 'timesince', 'timeuntil')
+
+_local = threading.local()
+_install_lock = threading.Lock()
+
+
+class FilterStats(object):
+    """
+    Calls and total seconds per filter and per (template, filter).
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.filters = {}
+        self.templates = {}
+
+    def add(self, name, template, elapsed):
+        with self.lock:
+            for table, key in ((self.filters, name),
+                               (self.templates, (template, name))):
+                entry = table.get(key)
+                if entry is None:
+                    table[key] = [1, elapsed]
+                else:
+                    entry[0] += 1
+                    entry[1] += elapsed
+
+    def report(self):
+        """
+        Return a text table of the (template, filter) pairs, most expensive
+        first.
+        """
+        rows = [('Template', 'Filter', 'Calls', 'Total ms', 'Mean us')]
+        for (template, name), (calls, seconds) in sorted(
+                self.templates.items(), key=lambda item: -item[1][1]):
+            rows.append((template, name, str(calls), '%.3f' % (seconds * 1e3),
+                         '%.1f' % (seconds * 1e6 / calls)))
+        widths = [max(len(row[i]) for row in rows) for i in range(5)]
+        return '\n'.join(
+            '  '.join([row[0].ljust(widths[0]), row[1].ljust(widths[1])] +
+                      [cell.rjust(width)
+                       for cell, width in zip(row[2:], widths[2:])])
+            for row in rows) + '\n'
+
+
+stats = FilterStats()
+
+
+def _empty(value):
+    return value is None or (
+        isinstance(value, six.string_types + (list, tuple, dict)) and
+        not value)
+
+
+def _codes(func):
+    """
+    Return the code objects of a filter and the functions it decorates.
+    """
+    codes = set()
+    while func is not None and getattr(func, '__code__', None) not in codes:
+        if getattr(func, '__code__', None) is not None:
+            codes.add(func.__code__)
+        func = getattr(func, '_decorated_function',
+                       getattr(func, '__wrapped__', None))
+    return codes
+
+
+def _swallowed(func, codes, value, args, kwargs):
+    """
+    Call the filter again, returning the class of the last exception it
+    caught, or None.
+    """
+    if sys.gettrace() is not None:
+        return None
+    raised = []
+
+    def trace_exceptions(frame, event, arg):
+        if event == 'exception':
+            raised.append(arg[0])
+        return trace_exceptions
+
+    def trace_calls(frame, event, arg):
+        if frame.f_code in codes:
+            return trace_exceptions
+        return None
+
+    sys.settrace(trace_calls)
+    try:
+        func(value, *args, **kwargs)
+    except Exception:
+        return None
+    finally:
+        sys.settrace(None)
+    return raised[-1] if raised else None
+
+
+def _current_template():
+    templates = getattr(_local, 'templates', None)
+    return templates[-1] if templates else template_name(None)
+
+
+class _Instrumentation(object):
+    def __init__(self, on_problem, stats, empty_ok, pure):
+        self.on_problem = on_problem
+        self.stats = stats
+        self.empty_ok = empty_ok
+        self.pure = pure
+
+    def call(self, name, func, codes, value, args, kwargs):
+        start = default_timer()
+        result = func(value, *args, **kwargs)
+        elapsed = default_timer() - start
+        template = _current_template()
+        self.stats.add(name, template, elapsed)
+        if (_empty(result) and not _empty(value) and
+                name not in self.empty_ok):
+            swallowed = None
+            if name in self.pure:
+                swallowed = _swallowed(func, codes, value, args, kwargs)
+            if swallowed is not None:
+                self.on_problem("Filter '%s' swallowed %s for %r in %s" % (
+                    name, swallowed.__name__, value, template))
+            else:
+                self.on_problem(
+                    "Filter '%s' returned an empty value for %r in %s" % (
+                        name, value, template))
+        return result
+
+
+def _wrap(name, func):
+    codes = _codes(func)
+
+    def wrapper(value, *args, **kwargs):
+        active = getattr(_local, 'active', None)
+        if not active:
+            return func(value, *args, **kwargs)
+        return active[-1].call(name, func, codes, value, args, kwargs)
+
+    for attribute in ('__name__', '__doc__', '__module__'):
+        if hasattr(func, attribute):
+            setattr(wrapper, attribute, getattr(func, attribute))
+    # is_safe, needs_autoescape, expects_localtime, ...
+    wrapper.__dict__.update(getattr(func, '__dict__', {}))
+    # Used by django to check the filter's arguments.
+    wrapper._decorated_function = getattr(func, '_decorated_function', func)
+    wrapper._pedant_wrapped = True
+    return wrapper
+
+
+def _install_library(library):
+    # Called with _install_lock held.
+    if getattr(library, '_pedant_installed', False):
+        return
+    library._pedant_installed = True
+    for name, func in list(library.filters.items()):
+        if not getattr(func, '_pedant_wrapped', False):
+            library.filters[name] = _wrap(name, func)
+
+
+def _libraries():
+    if django.VERSION < (1, 9):
+        from django.template import base
+        return list(base.builtins) + list(base.libraries.values())
+    from django.template import engines
+    from django.template.backends.django import DjangoTemplates
+    libraries = []
+    for engine in engines.all():
+        if isinstance(engine, DjangoTemplates):
+            libraries.extend(engine.engine.template_builtins)
+            libraries.extend(engine.engine.template_libraries.values())
+    return libraries
+
+
+def _install_get_library():
+    # Before django 1.9, {% load %} loads libraries when first used.
+    from django.template import base
+    from django.template import defaulttags
+    original_get_library = base.get_library
+    if getattr(original_get_library, '_pedant_wrapped', False):
+        return
+
+    def get_library(library_name):
+        library = original_get_library(library_name)
+        with _install_lock:
+            _install_library(library)
+        return library
+    get_library._pedant_wrapped = True
+    base.get_library = defaulttags.get_library = get_library
+
+
+def install():
+    """
+    Wrap the filters of the template libraries for instrumentation, once.
+    Libraries loaded later are wrapped by the next call (and, before django
+    1.9, when they are loaded).
+    """
+    libraries = _libraries()
+    with _install_lock:
+        if django.VERSION < (1, 9):
+            _install_get_library()
+        for library in libraries:
+            _install_library(library)
+
+
+def _template_render(original_render):
+    def render(self, context):
+        templates = getattr(_local, 'templates', None)
+        if templates is None:
+            templates = _local.templates = []
+        templates.append(template_name(self))
+        try:
+            return original_render(self, context)
+        finally:
+            templates.pop()
+    return render
+
+
+_template_names = SharedPatch(lambda: patch_object(
+    Template, 'render', _template_render(Template.render)))
+
+
+class filter_instrumentation(object):
+    """
+    Context manager that instruments filters, calling ``on_problem(message)``
+    for silent failures. Returns the FilterStats counting calls.
+    """
+    def __init__(self, on_problem, stats=stats):
+        self.on_problem = on_problem
+        self.stats = stats
+        self._entered = []
+
+    def __enter__(self):
+        install()
+        _template_names.__enter__()
+        instrumentation = _Instrumentation(
+            self.on_problem, self.stats,
+            getattr(settings, 'PEDANT_FILTER_EMPTY_OK', EMPTY_OK),
+            getattr(settings, 'PEDANT_FILTER_PURE', PURE))
+        active = getattr(_local, 'active', None)
+        if active is None:
+            active = _local.active = []
+        active.append(instrumentation)
+        self._entered.append(instrumentation)
+        return self.stats
+
+    def __exit__(self, *exc_info):
+        # Blocks may end in any order, so remove this one's own.
+        _local.active.remove(self._entered.pop())
+        _template_names.__exit__(*exc_info)
+
+
+def _fail(message):
+    raise PedanticTemplateRenderingError(message)
+
+
+@decorator
+def fail_on_filter_errors(f, *args, **kwargs):
+    """
+    Decorator that raises when a filter fails silently.
+    """
+    with filter_instrumentation(_fail):
+        return f(*args, **kwargs)
+
+
+def log_filter_errors(logger, log_level=logging.ERROR):
+    """
+    Decorator to log filters failing silently to the specified logger.
+
+    @log_filter_errors(logging.getLogger('mylogger'), logging.INFO)
+    def my_view(*args):
+        pass
+    """
+    def log(message):
+        logger.log(log_level, message)
+
+    @decorator
+    def function(f, *args, **kwargs):
+        with filter_instrumentation(log):
+            return f(*args, **kwargs)
+
+    return function
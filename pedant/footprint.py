@@ -0,0 +1,66 @@
+"""
+Measure what importing pedant costs a freshly started process.
+
+The import is done in a child interpreter after django's own template
+machinery has been imported, so the numbers are pedant's marginal cost:
+
+    $ DJANGO_SETTINGS_MODULE=myproject.settings python -m pedant.footprint
+"""
+import json
+import subprocess
+import sys
+
+# Modules that only tests should need. Finding one of these imported by
+# pedant's runtime modules is a regression.
+TEST_ONLY_MODULES = ('mock', 'nose', 'django.test', 'unittest')
+
+_CHILD = '''
+import json, resource, sys, timeit
+import django.template.base, django.template.defaulttags, django.conf
+before = set(sys.modules)
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = timeit.default_timer()
+for name in sys.argv[1:]:
+    __import__(name)
+seconds = timeit.default_timer() - start
+new = sorted(m for m in set(sys.modules) - before if sys.modules[m])
+json.dump({
+    'seconds': seconds,
+    'max_rss_growth': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss,
+    'modules': new,
+}, sys.stdout)
+'''
+
+
+def measure(modules=('pedant.decorators',)):
+    """
+    Import ``modules`` in a child process and report what it cost.
+
+    Returns a dict with the import time in ``seconds``, the growth of the
+    peak resident set size (``max_rss_growth``, in the platform's
+    ``ru_maxrss`` units: KB on Linux), the newly imported ``modules`` and the
+    ``test_only_modules`` among them.
+    """
+    output = subprocess.check_output(
+        [sys.executable, '-c', _CHILD] + list(modules))
+    result = json.loads(output.decode('utf-8'))
+    result['test_only_modules'] = [
+        name for name in result['modules']
+        if name.split('.')[0] in TEST_ONLY_MODULES or
+        name in TEST_ONLY_MODULES]
+    return result
+
+
+def main():
+    modules = sys.argv[1:] or ['pedant.decorators']
+    result = measure(modules)
+    print('Imported %s' % ', '.join(modules))
+    print('  time:            %.1f ms' % (result['seconds'] * 1000))
+    print('  peak RSS growth: %d' % result['max_rss_growth'])
+    print('  new modules:     %d' % len(result['modules']))
+    print('  test-only:       %s' % (
+        ', '.join(result['test_only_modules']) or 'none'))
+
+
+if __name__ == '__main__':
+    main()
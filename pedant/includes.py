@@ -0,0 +1,169 @@
+"""
+Report ``{% include %}`` failures, and remember which templates exist.
+
+Without ``TEMPLATE_DEBUG``, django renders an include that fails, e.g. because
+``{% include row_template %}`` names a template that does not exist, as an
+empty string, and every render asks the template loaders for the missing name
+again. ``include_checking`` is part of pedant's strict and log modes. It
+reports such failures with the computed name and the including template:
+
+    {% include row_template %} at list.html:3 loads 'rows/bok.html', which
+    does not exist
+
+and keeps a bounded cache (``PEDANT_INCLUDE_CACHE_SIZE`` names, 1000 by
+default) of the templates loaded and found missing, so that a loop including
+the same names goes to the loaders once. The cache is kept on the render's
+Context, so it only lasts for one render and template files that change are
+picked up by the next, as they would be without pedant.
+
+Errors raised while rendering an included template propagate unchanged in
+strict mode, and in log mode with debug on. In log mode with debug off, they
+are reported and the include renders as ``''``, as it would without pedant.
+"""
+import copy
+from collections import OrderedDict
+
+import django
+from django.conf import settings
+from django.template import loader_tags
+from django.template import TemplateDoesNotExist
+from django.template.base import TemplateSyntaxError
+from django.template.loader_tags import IncludeNode
+from django.utils import six
+
+from pedant.introspection import current_template_name
+from pedant.introspection import node_lineno
+from pedant.introspection import template_name
+from pedant.patching import patch_object
+
+DEFAULT_CACHE_SIZE = 1000
+
+
+class TemplateCache(object):
+    """
+    Least recently used cache of loaded templates, and of the
+    TemplateDoesNotExist errors of missing ones.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+
+    def get_template(self, engine, name):
+        key = (engine, name)
+        try:
+            entry = self.entries.pop(key)
+        except KeyError:
+            try:
+                entry = _load(engine, name)
+            except TemplateDoesNotExist as e:
+                entry = e
+            if len(self.entries) >= self.size:
+                self.entries.popitem(last=False)
+        self.entries[key] = entry
+        if isinstance(entry, TemplateDoesNotExist):
+            raise copy.copy(entry)
+        return entry
+
+
+def _engine(context):
+    if django.VERSION < (1, 8):
+        return None
+    return context.template.engine
+
+
+def _debug(context):
+    if django.VERSION < (1, 8):
+        return settings.TEMPLATE_DEBUG
+    return context.template.engine.debug
+
+
+def _load(engine, name):
+    if engine is None:
+        return loader_tags.get_template(name)
+    return engine.get_template(name)
+
+
+def get_template(context, name):
+    """
+    Load template ``name`` for an include rendered in ``context``, caching
+    it (or its absence) for the rest of the render.
+    """
+    # Copied to the contexts of isolated includes along with the context.
+    cache = getattr(context, '_pedant_templates', None)
+    if cache is None:
+        cache = context._pedant_templates = TemplateCache(getattr(
+            settings, 'PEDANT_INCLUDE_CACHE_SIZE', DEFAULT_CACHE_SIZE))
+    return cache.get_template(_engine(context), name)
+
+
+def _where(node):
+    where = '{%% include %s %%} at %s' % (
+        node.template.token, current_template_name())
+    line = node_lineno(node)
+    return where if line is None else '%s:%s' % (where, line)
+
+
+def failure_message(node, name, error):
+    """
+    Return the message for an include of ``name`` failing with ``error``.
+    """
+    if callable(getattr(name, 'render', None)):
+        name = template_name(name)
+    elif not isinstance(name, six.string_types):
+        return '%s resolved to %r, which is not a template name' % (
+            _where(node), name)
+    if isinstance(error, TemplateDoesNotExist) and error.args and (
+            error.args[0] == name):
+        return "%s loads '%s', which does not exist" % (_where(node), name)
+    return "%s failed to render '%s': %s: %s" % (
+        _where(node), name, error.__class__.__name__, error)
+
+
+class include_checking(object):
+    """
+    Context manager that calls ``on_failure(message)`` when an include fails.
+    If it returns, the include renders as it would without pedant. With
+    ``propagate``, errors raised by the included template are not caught.
+    """
+    def __init__(self, on_failure, propagate=False):
+        self.on_failure = on_failure
+        self.propagate = propagate
+        self._entered = []
+
+    def __enter__(self):
+        on_failure = self.on_failure
+        propagate = self.propagate
+
+        def render(self, context):
+            template = name = self.template.resolve(context)
+            if not callable(getattr(template, 'render', None)):
+                try:
+                    if not isinstance(name, six.string_types):
+                        raise TemplateDoesNotExist(name)
+                    template = get_template(context, name)
+                except (TemplateDoesNotExist, TemplateSyntaxError) as e:
+                    on_failure(failure_message(self, name, e))
+                    if _debug(context):
+                        raise
+                    return ''
+            try:
+                values = dict(
+                    (key, var.resolve(context))
+                    for key, var in six.iteritems(self.extra_context))
+                if self.isolated_context:
+                    return template.render(context.new(values))
+                with context.push(**values):
+                    return template.render(context)
+            except Exception as e:
+                if propagate or _debug(context):
+                    raise
+                on_failure(failure_message(self, name, e))
+                return ''
+
+        patches = patch_object(IncludeNode, 'render', render)
+        patches.__enter__()
+        self._entered.append(patches)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._entered.pop().__exit__(*exc_info)
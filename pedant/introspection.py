@@ -0,0 +1,196 @@
+"""
+Helpers for finding out what django is rendering from inside a pedant hook.
+
+The hooks pedant installs (``string_if_invalid.__mod__``, the patched
+``VariableNode.render``, ...) are not passed the template being rendered. On
+the error path it is cheap enough to walk the interpreter stack and find the
+innermost ``Template`` or ``Node`` being rendered, so nothing has to be
+threaded through the (much hotter) success path.
+"""
+import sys
+import weakref
+from bisect import bisect_left
+
+from django.template.base import FilterExpression
+from django.template.base import Node
+from django.template.base import NodeList
+from django.template.base import Template
+from django.template.base import Variable
+from django.template.context import Context
+from django.utils import six
+
+UNKNOWN_TEMPLATE = '<unknown source>'
+
+# origin -> offsets of the newlines in its source, for Django < 1.9.
+_newlines = weakref.WeakKeyDictionary()
+
+# Attributes that builtin tags (and simple_tag/assignment_tag) use to store
+# the name of a variable they set, e.g. {% url ... as the_url %}.
+_TARGET_ATTRIBUTES = ('var_name', 'target_var', 'asvar', 'variable_name')
+
+
+def _frame_selves():
+    frame = sys._getframe(1)
+    while frame is not None:
+        yield frame.f_locals.get('self')
+        frame = frame.f_back
+
+
+def template_name(template):
+    """
+    Return the best available name for a compiled template.
+    """
+    name = getattr(template, 'name', None)
+    if name is None:
+        origin = getattr(template, 'origin', None)
+        name = getattr(origin, 'name', None)
+    return name or UNKNOWN_TEMPLATE
+
+
+def current_template():
+    """
+    Return the innermost ``Template`` currently being rendered, or None.
+    """
+    for obj in _frame_selves():
+        if isinstance(obj, Template):
+            return obj
+    return None
+
+
+def current_template_name():
+    """
+    Return the name of the innermost template currently being rendered.
+    """
+    return template_name(current_template())
+
+
+def current_node(node_types=Node):
+    """
+    Return the innermost node of one of ``node_types`` being rendered.
+    """
+    for obj in _frame_selves():
+        if isinstance(obj, node_types):
+            return obj
+    return None
+
+
+def current_context():
+    """
+    Return the innermost template ``Context`` being rendered with, or None.
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        context = frame.f_locals.get('context')
+        if isinstance(context, Context):
+            return context
+        frame = frame.f_back
+    return None
+
+
+def node_origin(node):
+    """
+    Return the ``Origin`` of the template ``node`` was parsed from, or None.
+    """
+    origin = getattr(node, 'origin', None)
+    if origin is None:
+        source = getattr(node, 'source', None)
+        if source is not None:
+            origin = source[0]
+    return origin
+
+
+def node_lineno(node):
+    """
+    Return the line number in its template at which ``node`` starts.
+
+    Django >= 1.9 always records the token a node was parsed from. Earlier
+    versions only record the source offsets of nodes when TEMPLATE_DEBUG is
+    on, so this may be None.
+    """
+    token = getattr(node, 'token', None)
+    if token is not None:
+        return token.lineno
+    source = getattr(node, 'source', None)
+    if source is None:
+        return None
+    origin, (start, _) = source
+    newlines = _newlines.get(origin)
+    if newlines is None:
+        newlines = _newlines[origin] = [
+            offset for offset, char in enumerate(origin.reload())
+            if char == '\n']
+    return bisect_left(newlines, start) + 1
+
+
+def _expressions(value):
+    if isinstance(value, FilterExpression):
+        yield value
+    elif isinstance(value, (Node, NodeList)):
+        # Children are found through Node.child_nodelists.
+        return
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            for expression in _expressions(item):
+                yield expression
+    elif isinstance(value, dict):
+        for item in value.values():
+            for expression in _expressions(item):
+                yield expression
+    else:
+        # Operators and literals of {% if %} conditions (see smartif.py).
+        for attribute in ('first', 'second', 'value'):
+            child = getattr(value, attribute, None)
+            if child is not None and child is not value:
+                for expression in _expressions(child):
+                    yield expression
+
+
+def _lookup_roots(expression):
+    if isinstance(expression.var, Variable) and expression.var.lookups:
+        yield expression.var.lookups[0]
+    for _, arguments in expression.filters:
+        for lookup, argument in arguments:
+            if lookup and isinstance(argument, Variable) and (
+                    argument.lookups):
+                yield argument.lookups[0]
+
+
+def expressions(node):
+    """
+    Return the FilterExpressions ``node`` itself uses, including those of
+    ``{% if %}`` conditions, but not those of the nodes nested inside it.
+    """
+    result = []
+    for attribute, value in vars(node).items():
+        if attribute not in ('token', 'origin', 'source'):
+            result.extend(_expressions(value))
+    return result
+
+
+def variable_names(node):
+    """
+    Return the names of the context variables ``node`` itself looks up.
+
+    Only the first part of a dotted lookup is returned, e.g. ``order`` for
+    ``{{ order.customer.name|default:fallback }}`` (along with ``fallback``).
+    Nodes nested inside ``node`` are not included.
+    """
+    names = set()
+    for expression in expressions(node):
+        names.update(_lookup_roots(expression))
+    return names
+
+
+def bound_names(node):
+    """
+    Return the names of the context variables ``node`` sets for its body.
+    """
+    names = set(getattr(node, 'loopvars', ()))
+    if names:
+        names.add('forloop')
+    names.update(getattr(node, 'extra_context', None) or ())
+    for attribute in _TARGET_ATTRIBUTES:
+        name = getattr(node, attribute, None)
+        if isinstance(name, six.string_types):
+            names.add(name)
+    return names
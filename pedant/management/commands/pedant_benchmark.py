@@ -0,0 +1,51 @@
+from optparse import make_option
+
+import django
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from pedant import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Time renders of the templates in PEDANT_BENCHMARKS and fail if '
+            'any got slower than the baseline.')
+
+    if django.VERSION < (1, 8):
+        option_list = BaseCommand.option_list + (
+            make_option('--baseline', dest='baseline',
+                        default=benchmark.DEFAULT_BASELINE_FILE),
+            make_option('--rounds', type='int', dest='rounds'),
+            make_option('--threshold', type='float', dest='threshold'),
+            make_option('--save', action='store_true', dest='save'),
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--baseline', dest='baseline',
+            default=benchmark.DEFAULT_BASELINE_FILE,
+            help='Baseline file to compare with (and to --save to).')
+        parser.add_argument(
+            '--rounds', type=int, dest='rounds',
+            help='Renders per context (default: PEDANT_BENCHMARK_ROUNDS).')
+        parser.add_argument(
+            '--threshold', type=float, dest='threshold',
+            help='Slowdown factor that fails (default: '
+                 'PEDANT_BENCHMARK_THRESHOLD).')
+        parser.add_argument(
+            '--save', action='store_true', dest='save',
+            help='Save the results as the new baseline.')
+
+    def handle(self, *args, **options):
+        results = benchmark.run(rounds=options.get('rounds'))
+        baseline = benchmark.load_baseline(options['baseline'])
+        self.stdout.write(benchmark.report(results, baseline), ending='')
+        if options.get('save'):
+            benchmark.save_baseline(results, options['baseline'])
+            return
+        slower = benchmark.regressions(
+            results, baseline, options.get('threshold'))
+        if slower:
+            raise CommandError('Templates got slower: %s' % ', '.join(
+                '%s (%.3fms -> %.3fms)' % (name, before * 1000, after * 1000)
+                for name, before, after in slower))
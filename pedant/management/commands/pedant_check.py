@@ -0,0 +1,67 @@
+import time
+from optparse import make_option
+from timeit import default_timer
+
+import django
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from pedant.checker import check_all
+from pedant.checker import TemplateWatcher
+
+
+class Command(BaseCommand):
+    help = ('Check template files for problems, such as {% cache %} '
+            'fragments that use variables they do not vary on.')
+
+    if django.VERSION < (1, 8):
+        args = '[template ...]'
+        option_list = BaseCommand.option_list + (
+            make_option('--watch', action='store_true', dest='watch'),
+            make_option('--interval', type='float', dest='interval',
+                        default=0.5),
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'templates', nargs='*',
+            help='Template files to check (default: all templates).')
+        parser.add_argument(
+            '--watch', action='store_true', dest='watch',
+            help='Keep checking templates (and those depending on them) as '
+                 'they change.')
+        parser.add_argument(
+            '--interval', type=float, dest='interval', default=0.5,
+            help='Seconds between checks for changes with --watch.')
+
+    def handle(self, *args, **options):
+        if options.get('watch'):
+            return self.watch(options['interval'])
+        paths = list(options.get('templates') or args) or None
+        problems = check_all(paths)
+        for problem in problems:
+            self.stdout.write(str(problem))
+        if problems:
+            raise CommandError('%d template problem(s) found' % len(problems))
+
+    def watch(self, interval):
+        """
+        Check templates as they change, until interrupted.
+        """
+        watcher = TemplateWatcher()
+        try:
+            while True:
+                start = default_timer()
+                checked = watcher.poll()
+                if checked:
+                    for path in sorted(checked):
+                        for problem in checked[path]:
+                            self.stdout.write(str(problem))
+                    self.stdout.write(
+                        'Checked %d template(s) in %.1fms; %d problem(s) in '
+                        'all templates.' % (
+                            len(checked), (default_timer() - start) * 1000,
+                            sum(map(len, watcher.problems.values()))))
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,38 @@
+from optparse import make_option
+
+import django
+from django.core.management.base import BaseCommand
+
+from pedant import benchmark
+from pedant import cost
+
+
+class Command(BaseCommand):
+    help = ('Rank templates by their estimated render cost, calibrated with '
+            'the pedant_benchmark baseline if there is one.')
+
+    if django.VERSION < (1, 8):
+        option_list = BaseCommand.option_list + (
+            make_option('--baseline', dest='baseline',
+                        default=benchmark.DEFAULT_BASELINE_FILE),
+            make_option('--limit', type='int', dest='limit'),
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--baseline', dest='baseline',
+            default=benchmark.DEFAULT_BASELINE_FILE,
+            help='Benchmark baseline to calibrate the estimates with.')
+        parser.add_argument(
+            '--limit', type=int, dest='limit',
+            help='Only show the most expensive templates.')
+
+    def handle(self, *args, **options):
+        estimates = cost.estimate_all()
+        baseline = benchmark.load_baseline(options['baseline'])
+        # Calibrated with all templates, even if only some are shown.
+        scale = cost.calibrate(estimates, baseline)
+        if options.get('limit'):
+            estimates = estimates[:options['limit']]
+        self.stdout.write(
+            cost.report(estimates, baseline, scale), ending='')
@@ -0,0 +1,36 @@
+from optparse import make_option
+
+import django
+from django.core.management.base import BaseCommand
+
+from pedant.template_coverage import combine
+from pedant.template_coverage import DEFAULT_DATA_FILE
+
+
+class Command(BaseCommand):
+    help = ('Combine the per-process template coverage files and print a '
+            'report.')
+
+    if django.VERSION < (1, 8):
+        args = '[data_file]'
+        option_list = BaseCommand.option_list + (
+            make_option('--coverage-data', dest='coverage_data'),
+            make_option('--keep', action='store_true', dest='keep'),
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('data_file', nargs='?', default=DEFAULT_DATA_FILE)
+        parser.add_argument(
+            '--coverage-data', dest='coverage_data',
+            help='Also write executed lines to this coverage.py data file.')
+        parser.add_argument(
+            '--keep', action='store_true', dest='keep',
+            help="Don't replace the per-process files with the merged one.")
+
+    def handle(self, *args, **options):
+        data_file = options.get('data_file') or (
+            args[0] if args else DEFAULT_DATA_FILE)
+        data = combine(data_file, keep=options.get('keep'))
+        self.stdout.write(data.report(), ending='')
+        if options.get('coverage_data'):
+            data.write_coverage_data(options['coverage_data'])
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from pedant.metrics import get_table
+from pedant.metrics import render_text
+
+
+class Command(BaseCommand):
+    help = "Print this host's pedant metrics in Prometheus text format."
+
+    def handle(self, *args, **options):
+        table = get_table()
+        if table is None:
+            raise CommandError('PEDANT_METRICS_FILE is not configured.')
+        self.stdout.write(render_text(table), ending='')
@@ -0,0 +1,65 @@
+import os
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.template.base import Context
+from django.template.base import Template
+from django.template.loader import get_template
+
+from pedant.decorators import fail_on_template_errors
+from pedant.snapshots import load
+from pedant.snapshots import snapshot_files
+
+
+def _template(snapshot):
+    if snapshot['source'] is not None:
+        return Template(snapshot['source'], name=snapshot['template'])
+    template = get_template(snapshot['template'])
+    if django.VERSION >= (1, 8):
+        template = template.template
+    return template
+
+
+@fail_on_template_errors
+def replay(snapshot):
+    """
+    Render a snapshot again in strict mode.
+    """
+    return _template(snapshot).render(Context(snapshot['context']))
+
+
+class Command(BaseCommand):
+    help = ('Render the snapshots of failed renders again, with '
+            'fail_on_template_errors.')
+
+    if django.VERSION < (1, 8):
+        args = '[snapshot ...]'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'snapshots', nargs='*',
+            help='Snapshot files or directories (default: '
+                 'PEDANT_SNAPSHOT_DIR).')
+
+    def handle(self, *args, **options):
+        paths = list(options.get('snapshots') or args)
+        if not paths:
+            directory = getattr(settings, 'PEDANT_SNAPSHOT_DIR', None)
+            if not directory:
+                raise CommandError('PEDANT_SNAPSHOT_DIR is not configured.')
+            paths = [directory]
+        for path in paths:
+            files = snapshot_files(path) if os.path.isdir(path) else [path]
+            for snapshot_file in files:
+                snapshot = load(snapshot_file)
+                try:
+                    replay(snapshot)
+                except Exception as e:
+                    result = 'reproduced: %s: %s' % (e.__class__.__name__, e)
+                else:
+                    result = 'did not reproduce'
+                self.stdout.write('%s: %s (%d times, originally %s): %s' % (
+                    snapshot_file, snapshot['template'], snapshot['count'],
+                    snapshot['error'], result))
@@ -0,0 +1,252 @@
+"""
+Host-wide pedant metrics kept in a memory-mapped counter table.
+
+Every process on a host that renders templates (e.g. each gunicorn worker)
+maps the same fixed-size file, given by the ``PEDANT_METRICS_FILE`` setting.
+The file is a header followed by an open-addressed hash table of slots, each
+holding a key, a call count and a cumulative time. Slots are claimed and
+updated under a POSIX record lock covering only that slot, so writers in
+different processes to different keys never contend with each other. Record
+locks don't exclude the threads of one process, so those also take the
+table's thread lock.
+
+If ``PEDANT_METRICS_FILE`` is unset, recording is a no-op. If the file can't
+be opened, the error is logged once to the ``pedant`` logger and nothing is
+recorded: metrics never fail a render.
+"""
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+from django.conf import settings
+from django.utils.encoding import force_bytes
+from django.utils.encoding import force_text
+
+MAGIC = b'PEDANT01'
+HEADER = struct.Struct('=8sQQ')  # magic, number of slots, dropped updates
+SLOT = struct.Struct('=QQQ')  # key hash, count, total nanoseconds
+KEY_SIZE = 232
+SLOT_SIZE = SLOT.size + KEY_SIZE
+DEFAULT_SLOTS = 4096
+
+ERROR = 'error'
+TIMING = 'timing'
+KEY_SEPARATOR = u'\t'
+
+logger = logging.getLogger('pedant')
+
+
+def _hash_key(key):
+    # Must be stable across processes, so the builtin hash() won't do. Zero
+    # marks an empty slot.
+    return ((zlib.crc32(key) & 0xffffffff) << 32 |
+            (zlib.adler32(key) & 0xffffffff)) or 1
+
+
+class CounterTable(object):
+    """
+    A fixed-size table of (count, total time) counters shared through mmap.
+
+    >>> import tempfile
+    >>> path = tempfile.mktemp()
+    >>> table = CounterTable(path, slots=8)
+    >>> table.increment(u'a', elapsed=0.5)
+    >>> table.increment(u'a', elapsed=0.25)
+    >>> CounterTable(path, slots=8).items()
+    [(u'a', 2, 0.75)]
+    >>> table.close(); os.unlink(path)
+    """
+    def __init__(self, path, slots=DEFAULT_SLOTS):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, HEADER.size, 0)
+        try:
+            size = os.fstat(self.fd).st_size
+            if size >= HEADER.size:
+                magic, slots, _ = HEADER.unpack(os.read(self.fd, HEADER.size))
+                if magic != MAGIC:
+                    raise ValueError('%s is not a pedant metrics file' % path)
+            else:
+                os.ftruncate(self.fd, HEADER.size + slots * SLOT_SIZE)
+                os.write(self.fd, HEADER.pack(MAGIC, slots, 0))
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, HEADER.size, 0)
+        self.slots = slots
+        self.map = mmap.mmap(self.fd, HEADER.size + slots * SLOT_SIZE)
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+    def _locked(self, offset, size, f, *args):
+        with self.lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, size, offset)
+            try:
+                return f(*args)
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, size, offset)
+
+    def _claim(self, offset, key_hash, key):
+        existing = SLOT.unpack_from(self.map, offset)[0]
+        if existing == 0:
+            SLOT.pack_into(self.map, offset, key_hash, 0, 0)
+            self.map[offset + SLOT.size:offset + SLOT_SIZE] = (
+                key.ljust(KEY_SIZE, b'\0'))
+            return key_hash
+        return existing
+
+    def _add(self, offset, count, nanoseconds):
+        key_hash, old_count, old_ns = SLOT.unpack_from(self.map, offset)
+        SLOT.pack_into(self.map, offset, key_hash,
+                       old_count + count, old_ns + nanoseconds)
+
+    def _drop(self):
+        magic, slots, dropped = HEADER.unpack_from(self.map, 0)
+        HEADER.pack_into(self.map, 0, magic, slots, dropped + 1)
+
+    def increment(self, key, count=1, elapsed=0.0):
+        """
+        Add ``count`` calls and ``elapsed`` seconds to the counter for ``key``.
+
+        If the table is full the update is dropped and counted in the header.
+        """
+        key = force_bytes(key)[:KEY_SIZE]
+        key_hash = _hash_key(key)
+        start = key_hash % self.slots
+        for probe in range(self.slots):
+            offset = HEADER.size + ((start + probe) % self.slots) * SLOT_SIZE
+            existing = SLOT.unpack_from(self.map, offset)[0]
+            if existing == 0:
+                existing = self._locked(
+                    offset, SLOT_SIZE, self._claim, offset, key_hash, key)
+            if existing == key_hash:
+                self._locked(offset, SLOT_SIZE, self._add,
+                             offset, count, int(elapsed * 1e9))
+                return
+        self._locked(0, HEADER.size, self._drop)
+
+    @property
+    def dropped(self):
+        return HEADER.unpack_from(self.map, 0)[2]
+
+    def items(self):
+        """
+        Return a list of (key, count, total seconds) for every used slot.
+        """
+        result = []
+        for slot in range(self.slots):
+            offset = HEADER.size + slot * SLOT_SIZE
+            key_hash, count, nanoseconds = SLOT.unpack_from(self.map, offset)
+            if key_hash:
+                key = self.map[offset + SLOT.size:offset + SLOT_SIZE]
+                result.append((force_text(key.rstrip(b'\0'), errors='replace'),
+                               count, nanoseconds / 1e9))
+        return result
+
+
+# {path: CounterTable, or None if it can't be opened}
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def get_table():
+    """
+    Return the CounterTable for this process, or None if metrics are off.
+    """
+    path = getattr(settings, 'PEDANT_METRICS_FILE', None)
+    if not path:
+        return None
+    try:
+        return _tables[path]
+    except KeyError:
+        pass
+    with _tables_lock:
+        if path not in _tables:
+            slots = getattr(settings, 'PEDANT_METRICS_SLOTS', DEFAULT_SLOTS)
+            try:
+                _tables[path] = CounterTable(path, slots)
+            except (EnvironmentError, ValueError):
+                logger.exception(
+                    'Could not open the metrics file %s; not recording '
+                    'metrics to it', path)
+                _tables[path] = None
+        return _tables[path]
+
+
+def record_error(kind, template, variable):
+    """
+    Count one template error of ``kind`` for ``variable`` in ``template``.
+    """
+    table = get_table()
+    if table is not None:
+        table.increment(KEY_SEPARATOR.join(
+            [ERROR, force_text(kind), force_text(template),
+             force_text(variable)]))
+
+
+def record_timing(hook, elapsed, calls=1):
+    """
+    Add ``calls`` invocations taking ``elapsed`` seconds in total to ``hook``.
+    """
+    table = get_table()
+    if table is not None:
+        table.increment(KEY_SEPARATOR.join([TIMING, force_text(hook)]),
+                        count=calls, elapsed=elapsed)
+
+
+def _label(value):
+    return (value.replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def render_text(table):
+    """
+    Render the table in the Prometheus text exposition format.
+    """
+    errors = []
+    calls = []
+    seconds_totals = []
+    for key, count, seconds in sorted(table.items()):
+        parts = key.split(KEY_SEPARATOR)
+        if parts[0] == ERROR and len(parts) == 4:
+            errors.append(
+                u'pedant_template_errors_total'
+                u'{kind="%s",template="%s",variable="%s"} %d' % (
+                    tuple(_label(p) for p in parts[1:]) + (count,)))
+        elif parts[0] == TIMING and len(parts) == 2:
+            label = _label(parts[1])
+            calls.append(
+                u'pedant_hook_calls_total{hook="%s"} %d' % (label, count))
+            seconds_totals.append(
+                u'pedant_hook_seconds_total{hook="%s"} %.9f' % (
+                    label, seconds))
+    # Each family's samples must follow its own TYPE line.
+    lines = [
+        u'# TYPE pedant_template_errors_total counter',
+    ] + errors + [
+        u'# TYPE pedant_hook_calls_total counter',
+    ] + calls + [
+        u'# TYPE pedant_hook_seconds_total counter',
+    ] + seconds_totals + [
+        u'# TYPE pedant_metrics_dropped_total counter',
+        u'pedant_metrics_dropped_total %d' % table.dropped,
+    ]
+    return u'\n'.join(lines) + u'\n'
+
+
+def metrics_view(request):
+    """
+    Serve the host's pedant metrics; mount this on an internal-only URL.
+    """
+    from django.http import HttpResponse
+    table = get_table()
+    if table is None:
+        return HttpResponse('PEDANT_METRICS_FILE is not configured.\n',
+                            status=404, content_type='text/plain')
+    return HttpResponse(render_text(table),
+                        content_type='text/plain; version=0.0.4')
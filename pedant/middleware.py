@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.utils.encoding import force_bytes
+
+from pedant import instrumentation
+from pedant import metrics
+
+
+class PedanticTimingMiddleware(object):
+    """
+    Time pedant's hooks for each request.
+
+    The summary is stored on ``request.pedant_timings``, sent in a
+    ``Server-Timing`` header and added to the host-wide metrics table.
+    Requires ``PEDANT_INSTRUMENT = True``.
+    """
+    def process_request(self, request):
+        instrumentation.start()
+
+    def process_response(self, request, response):
+        timings = instrumentation.stop()
+        request.pedant_timings = timings
+        if timings:
+            response['Server-Timing'] = (
+                instrumentation.server_timing_header(timings))
+            for name, (calls, seconds) in timings.items():
+                metrics.record_timing(name, seconds, calls)
+        return response
+
+
+class PedanticPanelMiddleware(object):
+    """
+    Record the templates, template errors and queries of each request while
+    ``DEBUG`` is on, for ``pedant.panel``.
+
+    The record is stored on ``request.pedant_panel`` and kept for
+    ``panel_view``. HTML responses get an overlay with the report.
+    """
+    def process_request(self, request):
+        if settings.DEBUG:
+            from pedant.panel import panel_recording
+            request._pedant_panel_recording = panel_recording(
+                request.get_full_path())
+            request.pedant_panel = request._pedant_panel_recording.__enter__()
+
+    def process_response(self, request, response):
+        recording = getattr(request, '_pedant_panel_recording', None)
+        if recording is None:
+            return response
+        from pedant.panel import overlay
+        from pedant.panel import remember
+        del request._pedant_panel_recording
+        recording.__exit__(None, None, None)
+        remember(request.pedant_panel)
+        if (response.get('Content-Type', '').startswith('text/html') and
+                not getattr(response, 'streaming', False) and
+                not response.has_header('Content-Encoding')):
+            content = response.content
+            index = content.rfind(b'</body>')
+            if index != -1:
+                response.content = (
+                    content[:index] +
+                    force_bytes(overlay(request.pedant_panel)) +
+                    content[index:])
+                if response.has_header('Content-Length'):
+                    response['Content-Length'] = str(len(response.content))
+        return response
@@ -0,0 +1,242 @@
+"""
+A per-request panel of what templates did, for local development.
+
+``PedanticPanelMiddleware`` records, for each request while ``DEBUG`` is on:
+
+- every template rendered, nested as they were rendered, with the time spent
+  rendering it (including the templates it includes or extends),
+- the template errors pedant found (the request is rendered in log mode, so
+  they don't stop the page),
+- the queries run while rendering, with the template, line and expression
+  that ran them, e.g. ``{{ order.lines.count }}``.
+
+HTML pages get a collapsed overlay with the report. The reports of the last
+``PEDANT_PANEL_HISTORY`` (20) requests, including those for JSON or other
+responses, are served by ``panel_view``; mount it on a local-only URL.
+
+The hooks are installed while at least one request is being recorded, and
+send what they see to the record of the request their thread is handling, so
+overlapping requests (e.g. with runserver's threads) are recorded apart.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from timeit import default_timer
+
+from django.conf import settings
+from django.db.backends.utils import CursorWrapper
+from django.template.base import Template
+from django.utils.html import escape
+
+from pedant.decorators import logged_rendering
+from pedant.introspection import current_node
+from pedant.introspection import expressions
+from pedant.introspection import node_lineno
+from pedant.introspection import template_name
+from pedant.patching import patch_object
+from pedant.patching import PatchSet
+from pedant.patching import SharedPatch
+
+DEFAULT_HISTORY = 20
+
+_local = threading.local()
+_history = OrderedDict()
+_history_lock = threading.Lock()
+
+
+class PanelRecord(object):
+    """
+    What the templates of one request did.
+    """
+    def __init__(self, path):
+        self.path = path
+        # [name, nesting depth, seconds], in the order renders started.
+        self.templates = []
+        # (template, message)
+        self.errors = []
+        # (template, line, expression, sql, seconds)
+        self.queries = []
+        self.stack = []
+
+    def current_template(self):
+        return self.stack[-1][0] if self.stack else None
+
+    def log(self, level, message, *args):
+        # Collects pedant's log mode messages, in place of a logger.
+        self.errors.append(
+            (self.current_template(), message % args if args else message))
+
+
+def _current_record():
+    records = getattr(_local, 'records', None)
+    return records[-1] if records else None
+
+
+def _template_render(original_render):
+    def render(self, context):
+        record = _current_record()
+        if record is None:
+            return original_render(self, context)
+        entry = [template_name(self), len(record.stack), 0.0]
+        record.templates.append(entry)
+        record.stack.append(entry)
+        start = default_timer()
+        try:
+            return original_render(self, context)
+        finally:
+            entry[2] = default_timer() - start
+            record.stack.pop()
+    return render
+
+
+def _describe(node):
+    if node is None:
+        return ''
+    return ', '.join(expression.token for expression in expressions(node)
+                     ) or node.__class__.__name__
+
+
+def _execute(original_execute):
+    def execute(self, sql, *args, **kwargs):
+        record = _current_record()
+        if record is None or not record.stack:
+            return original_execute(self, sql, *args, **kwargs)
+        start = default_timer()
+        try:
+            return original_execute(self, sql, *args, **kwargs)
+        finally:
+            elapsed = default_timer() - start
+            node = current_node()
+            record.queries.append((
+                record.current_template(),
+                node_lineno(node) if node is not None else None,
+                _describe(node), sql, elapsed))
+    return execute
+
+
+class _RecordLogger(object):
+    """
+    Logger for log mode that sends messages to the thread's PanelRecord.
+    """
+    def log(self, level, message, *args, **kwargs):
+        record = _current_record()
+        if record is not None:
+            record.log(level, message, *args)
+
+
+_hooks = SharedPatch(lambda: PatchSet([
+    patch_object(Template, 'render', _template_render(Template.render)),
+    patch_object(CursorWrapper, 'execute', _execute(CursorWrapper.execute)),
+    patch_object(CursorWrapper, 'executemany',
+                 _execute(CursorWrapper.executemany)),
+    logged_rendering(_RecordLogger(), logging.WARNING),
+]))
+
+
+class panel_recording(object):
+    """
+    Context manager that records templates, errors and queries into a new
+    PanelRecord for ``path``, which it returns.
+    """
+    def __init__(self, path=''):
+        self.path = path
+        self._entered = []
+
+    def __enter__(self):
+        record = PanelRecord(self.path)
+        _hooks.__enter__()
+        records = getattr(_local, 'records', None)
+        if records is None:
+            records = _local.records = []
+        records.append(record)
+        self._entered.append(record)
+        return record
+
+    def __exit__(self, *exc_info):
+        # Blocks may end in any order, so remove this one's own.
+        _local.records.remove(self._entered.pop())
+        _hooks.__exit__(*exc_info)
+
+
+def remember(record):
+    """
+    Keep ``record`` for ``panel_view``, dropping the oldest.
+    """
+    with _history_lock:
+        _history[id(record)] = record
+        while len(_history) > getattr(
+                settings, 'PEDANT_PANEL_HISTORY', DEFAULT_HISTORY):
+            _history.popitem(last=False)
+
+
+def recent():
+    """
+    Return the remembered records, most recent first.
+    """
+    with _history_lock:
+        return list(reversed(_history.values()))
+
+
+def _table(header, rows):
+    return u'<table><tr>%s</tr>%s</table>' % (
+        u''.join(u'<th>%s</th>' % escape(cell) for cell in header),
+        u''.join(u'<tr>%s</tr>' % u''.join(
+            u'<td>%s</td>' % escape(cell) for cell in row) for row in rows))
+
+
+def summary(record):
+    return u'pedant: %d error(s), %d template(s) in %.1fms, %d query(s)' % (
+        len(record.errors), len(record.templates),
+        sum(seconds for _, depth, seconds in record.templates if not depth)
+        * 1000, len(record.queries))
+
+
+def render_panel(record):
+    """
+    Return the HTML report of a PanelRecord.
+    """
+    return u''.join([
+        u'<details class="pedant-panel"><summary>%s %s</summary>' % (
+            escape(record.path), escape(summary(record))),
+        u'<h4>Errors</h4>',
+        _table(('Template', 'Message'), [
+            (template or '', message) for template, message in record.errors]),
+        u'<h4>Templates</h4>',
+        _table(('Template', 'ms'), [
+            (u'\xa0\xa0' * depth + name, '%.3f' % (seconds * 1000))
+            for name, depth, seconds in record.templates]),
+        u'<h4>Queries</h4>',
+        _table(('Template', 'Line', 'Expression', 'ms', 'SQL'), [
+            (template or '', '' if line is None else str(line), expression,
+             '%.3f' % (seconds * 1000), sql)
+            for template, line, expression, sql, seconds in record.queries]),
+        u'</details>',
+    ])
+
+
+STYLE = (u'<style>.pedant-panel{font:12px monospace;background:#ffe;'
+         u'border:1px solid #cc9;padding:4px;text-align:left;color:#000}'
+         u'.pedant-panel td,.pedant-panel th{padding:0 6px;'
+         u'vertical-align:top}</style>')
+
+OVERLAY = (u'<div id="pedant-overlay" style="position:fixed;bottom:0;right:0;'
+           u'max-height:60%%;max-width:80%%;overflow:auto;z-index:99999">'
+           u'%s%s</div>')
+
+
+def overlay(record):
+    return OVERLAY % (STYLE, render_panel(record))
+
+
+def panel_view(request):
+    """
+    Serve the reports of the recent requests; only while ``DEBUG`` is on.
+    """
+    from django.http import HttpResponse
+    if not settings.DEBUG:
+        return HttpResponse('DEBUG is off.\n', status=404,
+                            content_type='text/plain')
+    return HttpResponse(
+        u'<!DOCTYPE html><html><head><title>pedant</title>%s</head><body>'
+        u'%s</body></html>' % (
+            STYLE, u''.join(render_panel(record) for record in recent())))
@@ -0,0 +1,127 @@
+"""
+Minimal attribute patching used to install pedant's hooks.
+
+This covers the small part of ``mock.patch`` that pedant needs at runtime, so
+that production processes don't have to import mock.
+"""
+import sys
+import threading
+from functools import wraps
+from importlib import import_module
+
+
+class _Patcher(object):
+    def __call__(self, f):
+        @wraps(f)
+        def patched(*args, **kwargs):
+            with self:
+                return f(*args, **kwargs)
+        return patched
+
+
+class AttributePatch(_Patcher):
+    """
+    Replace ``target.attribute`` with ``new`` as a decorator or with block.
+
+    Patches nest and may be re-entered (e.g. by a recursive decorated view);
+    each exit restores the value seen by the matching enter.
+    """
+    def __init__(self, target, attribute, new):
+        self.target = target
+        self.attribute = attribute
+        self.new = new
+        self._saved = []
+
+    def __enter__(self):
+        try:
+            original = vars(self.target)[self.attribute]
+            local = True
+        except (TypeError, KeyError):
+            original = getattr(self.target, self.attribute)
+            local = False
+        self._saved.append((original, local))
+        setattr(self.target, self.attribute, self.new)
+        return self.new
+
+    def __exit__(self, *exc_info):
+        original, local = self._saved.pop()
+        if local:
+            setattr(self.target, self.attribute, original)
+        else:
+            # The attribute came from somewhere else (a class, or the object
+            # wrapped by django's LazySettings); removing ours uncovers it.
+            delattr(self.target, self.attribute)
+            if not hasattr(self.target, self.attribute):
+                setattr(self.target, self.attribute, original)
+
+
+class SharedPatch(_Patcher):
+    """
+    Enter the patch returned by ``make_patch()`` while at least one with
+    block is active, in any thread.
+
+    Unlike other patches, blocks may end in any order (e.g. overlapping
+    requests): the patch is undone when the last one ends. What it installs
+    must behave like the original for the threads not using it.
+    """
+    def __init__(self, make_patch):
+        self.make_patch = make_patch
+        self._lock = threading.Lock()
+        self._count = 0
+        self._patch = None
+
+    def __enter__(self):
+        with self._lock:
+            if not self._count:
+                patch = self.make_patch()
+                patch.__enter__()
+                self._patch = patch
+            self._count += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self._lock:
+            self._count -= 1
+            if not self._count:
+                self._patch.__exit__(*exc_info)
+                self._patch = None
+
+
+class PatchSet(_Patcher):
+    """
+    Apply several patches together, undoing them in reverse order.
+    """
+    def __init__(self, patches):
+        self.patches = list(patches)
+
+    def __enter__(self):
+        entered = []
+        try:
+            for patcher in self.patches:
+                patcher.__enter__()
+                entered.append(patcher)
+        except:
+            exc_info = sys.exc_info()
+            for patcher in reversed(entered):
+                patcher.__exit__(*exc_info)
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        for patcher in reversed(self.patches):
+            patcher.__exit__(*exc_info)
+
+
+def patch_object(target, attribute, new):
+    """
+    Like ``mock.patch.object(target, attribute, new)``.
+    """
+    return AttributePatch(target, attribute, new)
+
+
+def patch(path, new):
+    """
+    Like ``mock.patch('package.module.attribute', new)``.
+    """
+    module, attribute = path.rsplit('.', 1)
+    return AttributePatch(import_module(module), attribute, new)
@@ -0,0 +1,258 @@
+"""
+Suggest ``select_related``/``prefetch_related`` arguments from templates.
+
+While tracing, every variable resolved by a template is checked
+for relations followed from model instances that came out of a queryset, as
+in ``{% for order in orders %}{{ order.customer.address.city }}``. Instances
+are tied back to the queryset (and the context variable) they came from, also
+through related managers (``{% for item in order.items.all %}``), so each
+root queryset gets the lookups that would have saved a query per row:
+
+    orders (Order): .select_related('customer__address')
+                    .prefetch_related('items__product')
+
+Lookups the queryset already has are not suggested again.
+"""
+import logging
+from contextlib import contextmanager
+
+import django
+from decorator import decorator
+from django.db.models import Model
+from django.db.models.query import QuerySet
+from django.template.base import Variable
+
+from pedant.patching import patch_object
+from pedant.patching import PatchSet
+
+SELECT = 'select_related'
+PREFETCH = 'prefetch_related'
+
+_relations_cache = {}
+
+
+def _model_relations(model):
+    """
+    Return {attribute name: SELECT or PREFETCH} for the model's relations.
+    """
+    if django.VERSION >= (1, 8):
+        relations = {}
+        for field in model._meta.get_fields():
+            if not field.is_relation:
+                continue
+            if field.auto_created and not field.concrete:
+                name = field.get_accessor_name()
+            else:
+                name = field.name
+            single = field.many_to_one or field.one_to_one
+            # GenericForeignKey is single-valued but can't be joined.
+            joinable = field.concrete or field.auto_created
+            relations[name] = SELECT if single and joinable else PREFETCH
+        return relations
+
+    opts = model._meta
+    relations = dict((field.name, SELECT)
+                     for field in opts.fields if field.rel is not None)
+    relations.update((field.name, PREFETCH) for field in opts.many_to_many)
+    relations.update((field.name, PREFETCH) for field in opts.virtual_fields)
+    for related in opts.get_all_related_objects():
+        relations[related.get_accessor_name()] = (
+            PREFETCH if related.field.rel.multiple else SELECT)
+    for related in opts.get_all_related_many_to_many_objects():
+        relations[related.get_accessor_name()] = PREFETCH
+    return relations
+
+
+def model_relations(model):
+    try:
+        return _relations_cache[model]
+    except KeyError:
+        relations = _relations_cache[model] = _model_relations(model)
+        return relations
+
+
+class _Root(object):
+    """
+    A queryset whose rows' relations are being traced.
+    """
+    def __init__(self, label, queryset):
+        self.label = label
+        self.model = queryset.model
+        self.select_related = queryset.query.select_related
+        self.prefetch_related = set(
+            getattr(lookup, 'prefetch_through', lookup)
+            for lookup in queryset._prefetch_related_lookups)
+        # Relation paths followed from rows, as tuples of (name, kind).
+        self.paths = set()
+
+    def _selected(self, names):
+        selected = self.select_related
+        for name in names:
+            if selected is True:
+                return True
+            if not selected or name not in selected:
+                return False
+            selected = selected[name]
+        return True
+
+    def suggestions(self):
+        """
+        Return the (select_related, prefetch_related) lookups to add.
+        """
+        select = set()
+        prefetch = set()
+        for path in self.paths:
+            names = tuple(name for name, _ in path)
+            if all(kind == SELECT for _, kind in path):
+                if not self._selected(names):
+                    select.add('__'.join(names))
+            elif '__'.join(names) not in self.prefetch_related:
+                prefetch.add('__'.join(names))
+        return _maximal(select), _maximal(prefetch)
+
+
+def _maximal(lookups):
+    """
+    Drop lookups that are a prefix of another, since those are implied.
+    """
+    return sorted(
+        lookup for lookup in lookups
+        if not any(other.startswith(lookup + '__') for other in lookups))
+
+
+class RelationTrace(object):
+    """
+    Relations followed in templates, per root queryset.
+    """
+    def __init__(self):
+        self.roots = []
+        # id() of querysets and rows -> (root, path from the root's rows).
+        self._querysets = {}
+        self._rows = {}
+        # Keep traced objects alive so their id()s aren't reused.
+        self._objects = []
+
+    def queryset_resolved(self, queryset, label):
+        if id(queryset) not in self._querysets:
+            self._objects.append(queryset)
+            self._querysets[id(queryset)] = (_Root(label, queryset), ())
+
+    def queryset_fetched(self, queryset):
+        origin = self._querysets.get(id(queryset))
+        if origin is None:
+            origin = (_Root(queryset.model._meta.object_name, queryset), ())
+        root, path = origin
+        if not path and root not in self.roots:
+            self.roots.append(root)
+        for row in queryset._result_cache:
+            self._objects.append(row)
+            self._rows[id(row)] = origin
+
+    def expression_resolved(self, lookups, context, value):
+        """
+        Record the relations followed by a template variable lookup.
+        """
+        try:
+            current = context[lookups[0]]
+        except KeyError:
+            return
+        if len(lookups) == 1:
+            if isinstance(value, QuerySet):
+                self.queryset_resolved(value, lookups[0])
+            return
+        origin = self._rows.get(id(current))
+        if origin is None:
+            return
+        root, path = origin
+        for name in lookups[1:]:
+            if not isinstance(current, Model):
+                return
+            kind = model_relations(type(current)).get(name)
+            if kind is None:
+                return
+            path += ((name, kind),)
+            root.paths.add(path)
+            if kind == PREFETCH:
+                if isinstance(value, QuerySet) and id(value) not in (
+                        self._querysets):
+                    self._objects.append(value)
+                    self._querysets[id(value)] = (root, path)
+                return
+            # The template already followed this relation, so it's cached.
+            current = getattr(current, name, None)
+
+    def suggestions(self):
+        """
+        Return a list of (label, model, select_related, prefetch_related).
+        """
+        result = []
+        for root in self.roots:
+            select, prefetch = root.suggestions()
+            if select or prefetch:
+                result.append((root.label, root.model, select, prefetch))
+        return result
+
+
+def _arguments(lookups):
+    return ', '.join("'%s'" % lookup for lookup in lookups)
+
+
+def format_suggestion(label, model, select, prefetch):
+    calls = ''
+    if select:
+        calls += '.select_related(%s)' % _arguments(select)
+    if prefetch:
+        calls += '.prefetch_related(%s)' % _arguments(prefetch)
+    return '%s (%s): %s' % (label, model._meta.object_name, calls)
+
+
+@contextmanager
+def tracing_relations():
+    """
+    Trace relations followed by templates rendered in a with block.
+
+    with tracing_relations() as trace:
+        render_to_string('orders.html', {'orders': Order.objects.all()})
+    trace.suggestions()
+    """
+    trace = RelationTrace()
+    # Variable rather than FilterExpression, which pedant's strict and log
+    # modes replace while they are active.
+    original_resolve = Variable.resolve
+    original_fetch_all = QuerySet._fetch_all
+
+    def resolve(self, context):
+        value = original_resolve(self, context)
+        if self.lookups:
+            trace.expression_resolved(self.lookups, context, value)
+        return value
+
+    def fetch_all(self):
+        fetched = self._result_cache is not None
+        original_fetch_all(self)
+        if not fetched:
+            trace.queryset_fetched(self)
+
+    with PatchSet([patch_object(Variable, 'resolve', resolve),
+                   patch_object(QuerySet, '_fetch_all', fetch_all)]):
+        yield trace
+
+
+def log_prefetch_suggestions(logger, log_level=logging.INFO):
+    """
+    Decorator to log lookups a view's querysets should add.
+
+    @log_prefetch_suggestions(logging.getLogger('mylogger'))
+    def my_view(*args):
+        pass
+    """
+    @decorator
+    def function(f, *args, **kwargs):
+        with tracing_relations() as trace:
+            result = f(*args, **kwargs)
+        for suggestion in trace.suggestions():
+            logger.log(log_level, '%s: %s', f.__name__,
+                       format_suggestion(*suggestion))
+        return result
+
+    return function
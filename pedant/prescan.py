@@ -0,0 +1,164 @@
+"""
+Find every non-UTF-8 bytestring in a context before rendering.
+
+Strict and log mode only catch an undecodable bytestring when a variable
+node renders it, which stops (or logs) the render partway through the page.
+With the ``PEDANT_PRESCAN`` setting on, they also walk the context once when
+a top-level template render starts and report every undecodable bytestring
+with its path, as it would be written in a template (``orders.2.name``).
+
+The walk follows dicts, lists, tuples, evaluated querysets and the public
+attributes of objects, at most ``PEDANT_PRESCAN_DEPTH`` (4) levels deep and
+``PEDANT_PRESCAN_MAX_ITEMS`` (10000) values in total. It never evaluates
+querysets or lazy objects. Paths allowed for ``unicode_decode_error`` by
+``PEDANT_ALLOWLIST`` are not reported.
+"""
+import threading
+import types
+from itertools import islice
+
+from django.conf import settings
+from django.template.base import Template
+from django.utils import six
+from django.utils.functional import empty
+from django.utils.functional import LazyObject
+
+from pedant.allowlist import suppressed
+from pedant.patching import patch_object
+
+DEFAULT_DEPTH = 4
+DEFAULT_MAX_ITEMS = 10000
+# As in pedant.decorators, which imports this module.
+UNICODE_DECODE_ERROR = 'unicode_decode_error'
+
+_local = threading.local()
+
+
+def _children(value):
+    if isinstance(value, dict):
+        return six.iteritems(value)
+    if isinstance(value, LazyObject):
+        if value._wrapped is empty:
+            return ()
+        value = value._wrapped
+    result_cache = getattr(value, '_result_cache', None)  # QuerySet
+    if isinstance(result_cache, list):
+        value = result_cache
+    if isinstance(value, (list, tuple)):
+        return enumerate(value)
+    if isinstance(value, (type, types.ModuleType, types.FunctionType,
+                          types.MethodType, types.BuiltinFunctionType)):
+        return ()
+    try:
+        attributes = vars(value)
+    except TypeError:
+        return ()
+    return ((name, attribute)
+            for name, attribute in six.iteritems(attributes)
+            if not name.startswith('_'))
+
+
+def _text(key):
+    # Part of a path; it must not fail, e.g. for non-UTF-8 bytes keys.
+    if isinstance(key, bytes):
+        return key.decode('utf-8', 'replace')
+    try:
+        return six.text_type(key)
+    except Exception:
+        return u'<%s>' % key.__class__.__name__
+
+
+def find_undecodable(values, max_depth=DEFAULT_DEPTH,
+                     max_items=DEFAULT_MAX_ITEMS):
+    """
+    Return [(path, bytestring)] for the non-UTF-8 bytestrings in the dict
+    ``values``, sorted by path.
+
+    >>> find_undecodable({'a': [b'ok', {'b': b'caf\\xc3'}]})
+    [(u'a.1.b', 'caf\\xc3')]
+    """
+    problems = []
+    stack = [(_text(key), value, 1)
+             for key, value in islice(six.iteritems(values), max_items)]
+    seen = set()
+    visited = 0
+    while stack:
+        path, value, depth = stack.pop()
+        visited += 1
+        if isinstance(value, bytes):
+            try:
+                value.decode('utf-8')
+            except UnicodeDecodeError:
+                problems.append((path, value))
+            continue
+        if (isinstance(value, six.text_type) or depth >= max_depth or
+                id(value) in seen):
+            continue
+        seen.add(id(value))
+        # Only take the children that fit in what is left of max_items.
+        stack.extend(
+            (u'%s.%s' % (path, _text(key)), child, depth + 1)
+            for key, child in islice(_children(value),
+                                     max_items - visited - len(stack)))
+    return sorted(problems)
+
+
+def find_in_context(context):
+    """
+    Return find_undecodable() for a template Context, using the settings.
+    """
+    values = {}
+    for dictionary in context.dicts:
+        values.update(dictionary)
+    return find_undecodable(
+        values,
+        getattr(settings, 'PEDANT_PRESCAN_DEPTH', DEFAULT_DEPTH),
+        getattr(settings, 'PEDANT_PRESCAN_MAX_ITEMS', DEFAULT_MAX_ITEMS))
+
+
+def undecodable_message(path, value):
+    return 'Undecodable bytestring in the context at %s: %r' % (
+        path, value[:40])
+
+
+class prescanning(object):
+    """
+    Context manager that calls ``on_undecodable(messages)`` with a message
+    per undecodable bytestring in the context of each top-level render, if
+    the ``PEDANT_PRESCAN`` setting is on.
+    """
+    def __init__(self, on_undecodable):
+        self.on_undecodable = on_undecodable
+        self._patches = []
+
+    def __enter__(self):
+        if not getattr(settings, 'PEDANT_PRESCAN', False):
+            self._patches.append(None)
+            return self
+        original_render = Template.render
+        on_undecodable = self.on_undecodable
+
+        def render(self, context):
+            if getattr(_local, 'rendering', False):
+                return original_render(self, context)
+            _local.rendering = True
+            try:
+                messages = [
+                    undecodable_message(path, value)
+                    for path, value in find_in_context(context)
+                    if not suppressed(UNICODE_DECODE_ERROR, path)]
+                if messages:
+                    on_undecodable(messages)
+                return original_render(self, context)
+            finally:
+                _local.rendering = False
+
+        patch = patch_object(Template, 'render', render)
+        patch.__enter__()
+        self._patches.append(patch)
+        return self
+
+    def __exit__(self, *exc_info):
+        patch = self._patches.pop()
+        if patch is not None:
+            patch.__exit__(*exc_info)
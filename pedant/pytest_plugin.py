@@ -0,0 +1,214 @@
+"""
+pytest plugin for pedantic template rendering.
+
+Installed as the ``pedant`` plugin through the ``pytest11`` entry point. Set
+the session-wide mode with ``--pedant-mode`` or the ``pedant_mode`` ini
+option:
+
+- ``strict``: template errors raise, as with ``fail_on_template_errors``.
+- ``log``: template errors are logged to the ``pedant`` logger.
+- ``off`` (default): rendering is left alone.
+
+The mode's hooks are installed once per session (that is, once per worker
+under pytest-xdist). Individual tests can override it with the
+``pedant_strict``/``pedant_log`` markers or fixtures. Errors seen by each test
+are listed in a terminal summary; they travel back from xdist workers on the
+test reports, so the summary covers the whole run.
+
+``--pedant-coverage=PATH`` measures template coverage in every process and
+prints the merged report at the end (see ``pedant.template_coverage``).
+"""
+import logging
+
+import pytest
+
+MODES = ('strict', 'log', 'off')
+USER_PROPERTY = 'pedant_template_errors'
+
+logger = logging.getLogger('pedant')
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('pedant')
+    group.addoption(
+        '--pedant-mode', choices=MODES, default=None,
+        help='Pedantic template rendering for the whole session: '
+             'strict, log or off.')
+    parser.addini(
+        'pedant_mode', default='off',
+        help='Default for --pedant-mode.')
+    group.addoption(
+        '--pedant-coverage', metavar='PATH', default=None,
+        help='Measure template coverage, saving per-process data next to '
+             'PATH and reporting the merged result.')
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers', 'pedant_strict: fail on template errors in this test.')
+    config.addinivalue_line(
+        'markers', 'pedant_log: only log template errors in this test.')
+    config.pluginmanager.register(_Reporter(), 'pedant-reporter')
+
+
+def pytest_sessionstart(session):
+    data_file = session.config.getoption('pedant_coverage')
+    if data_file:
+        from pedant import template_coverage
+        if not hasattr(session.config, 'workerinput'):
+            # Only the main process clears the previous run's data; workers
+            # save theirs at the end of the session.
+            template_coverage.erase(data_file)
+        template_coverage.start(data_file)
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_sessionfinish(session):
+    data_file = session.config.getoption('pedant_coverage')
+    if not data_file:
+        return
+    from pedant import template_coverage
+    template_coverage.stop()
+    if not hasattr(session.config, 'workerinput'):
+        # In the main process, after any xdist workers have saved theirs.
+        reporter = session.config.pluginmanager.getplugin('pedant-reporter')
+        reporter.coverage = template_coverage.combine(data_file)
+
+
+class _CollectingLogger(object):
+    """
+    Logger-like object that records messages for the current test.
+    """
+    def __init__(self):
+        self.messages = None
+
+    def log(self, level, msg, *args, **kwargs):
+        logger.log(level, msg, *args, **kwargs)
+        if self.messages is not None:
+            self.messages.append(msg % args if args else msg)
+
+
+def _session_mode(config):
+    return config.getoption('pedant_mode') or config.getini('pedant_mode')
+
+
+def _get_marker(item, name):
+    if hasattr(item, 'get_closest_marker'):
+        return item.get_closest_marker(name)
+    return item.get_marker(name)
+
+
+def _patches(mode, collector):
+    from pedant.decorators import logged_rendering
+    from pedant.decorators import strict_rendering
+    if mode == 'strict':
+        return strict_rendering()
+    elif mode == 'log':
+        return logged_rendering(collector, logging.ERROR)
+    return None
+
+
+@pytest.fixture(scope='session')
+def _pedant_session(request):
+    collector = _CollectingLogger()
+    mode = _session_mode(request.config)
+    patches = _patches(mode, collector)
+    if patches is not None:
+        patches.__enter__()
+    yield mode, patches, collector
+    if patches is not None:
+        patches.__exit__(None, None, None)
+
+
+def _override(request, mode):
+    """
+    Switch the rendering mode for the requesting test only.
+    """
+    session_mode, session_patches, collector = request.getfixturevalue(
+        '_pedant_session')
+    if mode == session_mode:
+        return
+    # Patches for different modes don't compose (a log hook inside a strict
+    # one would still raise), so take the session's off for this test.
+    if session_patches is not None:
+        session_patches.__exit__(None, None, None)
+    patches = _patches(mode, collector)
+    patches.__enter__()
+
+    def restore():
+        patches.__exit__(None, None, None)
+        if session_patches is not None:
+            session_patches.__enter__()
+    request.addfinalizer(restore)
+
+
+@pytest.fixture
+def pedant_strict(request):
+    """
+    Fail on template errors in this test.
+    """
+    _override(request, 'strict')
+
+
+@pytest.fixture
+def pedant_log(request):
+    """
+    Log template errors in this test; returns the list of messages logged.
+    """
+    _override(request, 'log')
+    return request.getfixturevalue('_pedant_session')[2].messages
+
+
+@pytest.fixture(autouse=True)
+def _pedant_test(request):
+    collector = request.getfixturevalue('_pedant_session')[2]
+    collector.messages = request.node._pedant_errors = []
+    if _get_marker(request.node, 'pedant_strict'):
+        request.getfixturevalue('pedant_strict')
+    elif _get_marker(request.node, 'pedant_log'):
+        request.getfixturevalue('pedant_log')
+    yield
+    collector.messages = None
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    errors = getattr(item, '_pedant_errors', None)
+    if errors is None:
+        return
+    if call.excinfo is not None:
+        from pedant.decorators import PedanticTemplateRenderingError
+        if call.excinfo.errisinstance(
+                (PedanticTemplateRenderingError, UnicodeDecodeError)):
+            errors.append(str(call.excinfo.value))
+    if errors and report.when == 'teardown':
+        report.user_properties.append((USER_PROPERTY, list(errors)))
+
+
+class _Reporter(object):
+    """
+    Gathers each test's errors in the main process and summarizes them.
+    """
+    def __init__(self):
+        self.errors = []
+        self.coverage = None
+
+    def pytest_runtest_logreport(self, report):
+        # Also called here for reports sent back by xdist workers.
+        for name, value in report.user_properties:
+            if name == USER_PROPERTY:
+                self.errors.append((report.nodeid, value))
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if self.errors:
+            terminalreporter.write_sep('=', 'pedant template errors')
+            for nodeid, messages in sorted(self.errors):
+                terminalreporter.write_line(
+                    '%s: %d' % (nodeid, len(messages)))
+                for message in messages:
+                    terminalreporter.write_line('    %s' % message)
+        if self.coverage is not None:
+            terminalreporter.write_sep('=', 'pedant template coverage')
+            terminalreporter.write(self.coverage.report())
@@ -0,0 +1,173 @@
+"""
+Flag querysets that hit the database more than once in a single render.
+
+A template like ``{% if items.exists %}{% for i in items %}{% endfor %}``
+``{{ items.count }}`` runs three queries for one queryset. While checking is
+on, every evaluation, ``count()`` and ``exists()`` that misses the queryset's
+result cache during a template render is recorded with the template and line
+that caused it. The second and later hits for the same query within one
+top-level render are reported, by raising ``PedanticTemplateRenderingError``
+or by logging.
+
+Querysets are considered the same if they run the same SQL for the same
+model, so ``{{ items.all }}`` clones are caught too.
+"""
+import logging
+import threading
+
+from decorator import decorator
+from django.db.models.query import QuerySet
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.template.base import Template
+
+from pedant.decorators import PedanticTemplateRenderingError
+from pedant.introspection import current_node
+from pedant.introspection import current_template_name
+from pedant.introspection import node_lineno
+from pedant.patching import patch_object
+from pedant.patching import PatchSet
+
+EVALUATION = 'evaluation'
+COUNT = 'count()'
+EXISTS = 'exists()'
+
+_local = threading.local()
+
+
+class _Tracker(object):
+    def __init__(self, on_repeat):
+        self.on_repeat = on_repeat
+        self.depth = 0
+        self.hits = {}
+
+
+def _query_key(queryset):
+    try:
+        sql, params = queryset.query.sql_with_params()
+        key = queryset.model, sql, tuple(params)
+        hash(key)
+    except EmptyResultSet:
+        return None
+    except Exception:
+        # An unkeyable query is just not tracked; it mustn't break rendering.
+        return None
+    return key
+
+
+def _record(queryset, kind):
+    tracker = getattr(_local, 'tracker', None)
+    if tracker is None or not tracker.depth:
+        return
+    node = current_node()
+    key = _query_key(queryset)
+    if node is None or key is None:
+        return
+    hits = tracker.hits.setdefault(key, [])
+    hits.append((kind, current_template_name(), node_lineno(node)))
+    if len(hits) > 1:
+        tracker.on_repeat(queryset, hits)
+
+
+def repeated_query_message(queryset, hits):
+    """
+    Describe the database hits for ``queryset`` in one render.
+    """
+    return 'QuerySet for %s hit the database %d times in one render: %s' % (
+        queryset.model._meta.object_name, len(hits),
+        ', '.join('%s at %s:%s' % hit for hit in hits))
+
+
+_original_fetch_all = QuerySet._fetch_all
+_original_count = QuerySet.count
+_original_exists = QuerySet.exists
+_original_template_render = Template.render
+
+
+def _fetch_all(self):
+    if self._result_cache is None:
+        _record(self, EVALUATION)
+    return _original_fetch_all(self)
+
+
+def _count(self):
+    if self._result_cache is None:
+        _record(self, COUNT)
+    return _original_count(self)
+
+
+def _exists(self):
+    if self._result_cache is None:
+        _record(self, EXISTS)
+    return _original_exists(self)
+
+
+def _template_render(self, context):
+    tracker = getattr(_local, 'tracker', None)
+    if tracker is None:
+        return _original_template_render(self, context)
+    if not tracker.depth:
+        tracker.hits = {}
+    tracker.depth += 1
+    try:
+        return _original_template_render(self, context)
+    finally:
+        tracker.depth -= 1
+
+
+class repeated_query_checking(object):
+    """
+    Context manager that calls ``on_repeat(queryset, hits)`` for every
+    repeated database hit. ``hits`` lists (kind, template, line) so far.
+    """
+    def __init__(self, on_repeat):
+        self.on_repeat = on_repeat
+        self.patches = PatchSet([
+            patch_object(QuerySet, '_fetch_all', _fetch_all),
+            patch_object(QuerySet, 'count', _count),
+            patch_object(QuerySet, 'exists', _exists),
+            patch_object(Template, 'render', _template_render),
+        ])
+        self._previous = []
+
+    def __enter__(self):
+        self._previous.append(getattr(_local, 'tracker', None))
+        _local.tracker = _Tracker(self.on_repeat)
+        self.patches.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.patches.__exit__(*exc_info)
+        _local.tracker = self._previous.pop()
+
+
+def _fail(queryset, hits):
+    raise PedanticTemplateRenderingError(
+        repeated_query_message(queryset, hits))
+
+
+@decorator
+def fail_on_repeated_queries(f, *args, **kwargs):
+    """
+    Decorator that raises when a render hits the DB twice for one queryset.
+    """
+    with repeated_query_checking(_fail):
+        return f(*args, **kwargs)
+
+
+def log_repeated_queries(logger, log_level=logging.ERROR):
+    """
+    Decorator to log repeated queryset evaluations to the specified logger.
+
+    @log_repeated_queries(logging.getLogger('mylogger'), logging.INFO)
+    def my_view(*args):
+        pass
+    """
+    def log(queryset, hits):
+        logger.log(log_level, repeated_query_message(queryset, hits))
+
+    @decorator
+    def function(f, *args, **kwargs):
+        with repeated_query_checking(log):
+            return f(*args, **kwargs)
+
+    return function
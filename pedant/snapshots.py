@@ -0,0 +1,301 @@
+"""
+Keep snapshots of renders that failed in log mode, to replay them later.
+
+When ``PEDANT_SNAPSHOT_DIR`` is set, every error logged by pedant's log mode
+records a snapshot of the failing render: the template (name and, where
+available, source), the error, and a copy of the context. Snapshots are
+written to the directory as JSON when the logged render finishes, and
+``./manage.py pedant_replay`` renders them again in strict mode.
+
+Memory, CPU and disk use are bounded even when every request fails:
+
+- Only the last ``PEDANT_SNAPSHOT_SIZE`` (50) distinct errors are kept, in
+  memory and on disk. A repeat of a kept error only bumps its count.
+- The context copy only goes ``PEDANT_SNAPSHOT_DEPTH`` (4) levels deep, keeps
+  at most ``MAX_ITEMS`` items per container and truncates long strings.
+  Objects are copied as dicts of their public attributes, and querysets that
+  haven't been evaluated are not evaluated, so replays are approximate.
+- Values whose key matches the ``PEDANT_SNAPSHOT_REDACT`` regular expression
+  (by default, anything that looks like a password, token or key) are
+  replaced with ``REDACTED``.
+
+Taking or writing a snapshot never fails the render: problems are logged to
+the ``pedant`` logger instead.
+"""
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import six
+from django.utils.encoding import force_text
+from django.utils.functional import empty
+from django.utils.functional import LazyObject
+
+from pedant.introspection import current_context
+from pedant.introspection import current_template
+from pedant.introspection import template_name
+
+DEFAULT_SIZE = 50
+DEFAULT_DEPTH = 4
+DEFAULT_REDACT = r'pass|secret|token|key|csrf|session|cookie|auth|card'
+MAX_ITEMS = 50
+MAX_STRING = 1000
+MAX_SOURCE = 100000
+REDACTED = '<redacted>'
+TRUNCATED = '<...>'
+BYTES_KEY = '__bytes__'
+SUFFIX = '.json'
+
+logger = logging.getLogger('pedant')
+
+
+def _repr(value):
+    try:
+        return force_text(repr(value), errors='replace')
+    except Exception:
+        return u'<%s>' % value.__class__.__name__
+
+
+def _text(value):
+    """
+    Return ``value`` as text, even when converting it raises.
+    """
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    try:
+        return six.text_type(value)
+    except Exception:
+        return _repr(value)
+
+
+class _Copier(object):
+    def __init__(self, depth, redact):
+        # Imported here to keep django.db out of pedant.decorators' imports.
+        from django.db.models.query import QuerySet
+        self.queryset_class = QuerySet
+        self.depth = depth
+        self.redact = re.compile(redact, re.IGNORECASE)
+
+    def copy_items(self, items, depth):
+        result = {}
+        for key, value in items:
+            if len(result) >= MAX_ITEMS:
+                result[TRUNCATED] = TRUNCATED
+                break
+            key = _text(key)
+            if key.startswith('_'):
+                continue
+            if self.redact.search(key):
+                result[key] = REDACTED
+            else:
+                result[key] = self.copy(value, depth + 1)
+        return result
+
+    def copy(self, value, depth=0):
+        """
+        Return a JSON-serializable copy of ``value``.
+        """
+        if value is None or isinstance(value, (bool, float) +
+                                       six.integer_types):
+            return value
+        if isinstance(value, six.text_type):
+            return value[:MAX_STRING]
+        if isinstance(value, bytes):
+            # Kept as bytes, so that UnicodeDecodeErrors can be replayed.
+            return {BYTES_KEY: base64.b64encode(value[:MAX_STRING]).decode()}
+        if depth >= self.depth:
+            return TRUNCATED
+        if isinstance(value, LazyObject):
+            if value._wrapped is empty:
+                return TRUNCATED
+            value = value._wrapped
+        if isinstance(value, dict):
+            return self.copy_items(value.items(), depth)
+        if isinstance(value, self.queryset_class):
+            if value._result_cache is None:
+                return TRUNCATED
+            value = value._result_cache
+        if isinstance(value, (list, tuple, set, frozenset)):
+            return [self.copy(item, depth + 1)
+                    for item in list(value)[:MAX_ITEMS]]
+        try:
+            attributes = vars(value)
+        except TypeError:
+            return _text(value)[:MAX_STRING]
+        return self.copy_items(attributes.items(), depth)
+
+
+def restore(value):
+    """
+    Undo the encoding of bytestrings in a snapshot's context.
+    """
+    if isinstance(value, dict):
+        if list(value) == [BYTES_KEY]:
+            return base64.b64decode(value[BYTES_KEY])
+        return dict((key, restore(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return [restore(item) for item in value]
+    return value
+
+
+def _flatten(context):
+    flat = {}
+    for dictionary in context.dicts:
+        flat.update(dictionary)
+    return flat
+
+
+def _template_source(template):
+    source = getattr(template, 'source', None)
+    if source is None:
+        try:
+            source = template.origin.reload()
+        except Exception:
+            return None
+    return source if len(source) <= MAX_SOURCE else None
+
+
+class SnapshotBuffer(object):
+    """
+    Ring buffer of the snapshots for the last ``size`` distinct errors, saved
+    to ``directory``.
+    """
+    def __init__(self, directory, size=DEFAULT_SIZE, depth=DEFAULT_DEPTH,
+                 redact=DEFAULT_REDACT):
+        self.directory = directory
+        self.size = size
+        self.copier = _Copier(depth, redact)
+        self.snapshots = OrderedDict()
+        self.dirty = set()
+        self.lock = threading.Lock()
+
+    def add(self, kind, error, template, context):
+        name = _text(template_name(template))
+        error = _text(error)
+        key = hashlib.sha1(
+            (u'%s\0%s' % (name, error)).encode('utf-8')).hexdigest()[:16]
+        with self.lock:
+            snapshot = self.snapshots.get(key)
+            if snapshot is not None:
+                snapshot['count'] += 1
+                self.dirty.add(key)
+                return
+        snapshot = {
+            'kind': kind,
+            'error': error,
+            'template': name,
+            'source': _template_source(template),
+            'context': self.copier.copy_items(
+                _flatten(context).items(), 0) if context is not None else {},
+            'time': time.time(),
+            'count': 1,
+        }
+        with self.lock:
+            self.snapshots[key] = snapshot
+            self.dirty.add(key)
+            while len(self.snapshots) > self.size:
+                self.dirty.discard(self.snapshots.popitem(last=False)[0])
+
+    def flush(self):
+        """
+        Write changed snapshots to files, keeping only the newest ``size``
+        files in the directory (which may be shared by several processes).
+        """
+        with self.lock:
+            changed = [(key, dict(self.snapshots[key])) for key in self.dirty]
+            self.dirty = set()
+        if not changed:
+            return
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        for key, snapshot in changed:
+            path = os.path.join(self.directory, key + SUFFIX)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(snapshot, f)
+            os.rename(path + '.tmp', path)
+        with self.lock:
+            kept = set(key + SUFFIX for key in self.snapshots)
+        # On equal times, prune the snapshots this process no longer keeps.
+        paths = sorted(snapshot_files(self.directory), key=lambda path: (
+            os.path.getmtime(path), os.path.basename(path) in kept))
+        for path in paths[:-self.size]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # Already pruned by another process.
+
+
+def snapshot_files(directory):
+    """
+    Return the snapshot files in ``directory``, oldest first.
+    """
+    paths = [os.path.join(directory, filename)
+             for filename in os.listdir(directory)
+             if filename.endswith(SUFFIX)]
+    return sorted(paths, key=os.path.getmtime)
+
+
+_buffers = {}
+_buffers_lock = threading.Lock()
+
+
+def get_buffer():
+    """
+    Return this process's SnapshotBuffer, or None if snapshots are off.
+    """
+    directory = getattr(settings, 'PEDANT_SNAPSHOT_DIR', None)
+    if not directory:
+        return None
+    with _buffers_lock:
+        if directory not in _buffers:
+            _buffers[directory] = SnapshotBuffer(
+                directory,
+                getattr(settings, 'PEDANT_SNAPSHOT_SIZE', DEFAULT_SIZE),
+                getattr(settings, 'PEDANT_SNAPSHOT_DEPTH', DEFAULT_DEPTH),
+                getattr(settings, 'PEDANT_SNAPSHOT_REDACT', DEFAULT_REDACT))
+        return _buffers[directory]
+
+
+def record(kind, error):
+    """
+    Snapshot the render currently failing with ``error``, if enabled.
+    """
+    snapshots = get_buffer()
+    if snapshots is None:
+        return
+    try:
+        snapshots.add(kind, error, current_template(), current_context())
+    except Exception:
+        logger.exception('Could not snapshot a render failing with %s', kind)
+
+
+class flushing(object):
+    """
+    Context manager that writes new snapshots to disk on exit.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        snapshots = get_buffer()
+        if snapshots is None:
+            return
+        try:
+            snapshots.flush()
+        except Exception:
+            logger.exception('Could not write snapshots to %s',
+                             snapshots.directory)
+
+
+def load(path):
+    with open(path) as f:
+        snapshot = json.load(f)
+    snapshot['context'] = restore(snapshot['context'])
+    return snapshot
@@ -0,0 +1,114 @@
+"""
+Render a template pedantically as a stream of chunks.
+
+``stream_template`` yields the output of each top-level node as soon as it is
+rendered, so it can be passed to ``StreamingHttpResponse``. Template
+inheritance is followed: ``{% extends %}`` continues with the parent's nodes,
+and ``{% block %}`` contents are streamed node by node too, so a page built
+on a base layout still comes out in small pieces.
+
+Strict rendering is only in effect while a chunk is being rendered, not
+while the consumer holds the generator, so other code running in between is
+not affected. A template error stops the stream at the chunk that caused it.
+"""
+from django.template.base import Node
+from django.template.base import TextNode
+from django.template.loader_tags import BLOCK_CONTEXT_KEY
+from django.template.loader_tags import BlockContext
+from django.template.loader_tags import BlockNode
+from django.template.loader_tags import ExtendsNode
+from django.utils.encoding import force_text
+
+from pedant.decorators import strict_rendering
+
+
+def _render_node(nodelist, node, context):
+    if hasattr(node, 'render_annotated'):  # Django >= 1.9
+        return node.render_annotated(context)
+    return nodelist.render_node(node, context)
+
+
+def _stream_extends(node, context):
+    # As in ExtendsNode.render.
+    compiled_parent = node.get_parent(context)
+    if BLOCK_CONTEXT_KEY not in context.render_context:
+        context.render_context[BLOCK_CONTEXT_KEY] = BlockContext()
+    block_context = context.render_context[BLOCK_CONTEXT_KEY]
+    block_context.add_blocks(node.blocks)
+    for parent_node in compiled_parent.nodelist:
+        if not isinstance(parent_node, TextNode):
+            if not isinstance(parent_node, ExtendsNode):
+                block_context.add_blocks(dict(
+                    (n.name, n) for n in
+                    compiled_parent.nodelist.get_nodes_by_type(BlockNode)))
+            break
+    return _stream_nodelist(compiled_parent.nodelist, context)
+
+
+def _stream_block(node, context):
+    # As in BlockNode.render.
+    block_context = context.render_context.get(BLOCK_CONTEXT_KEY)
+    with context.push():
+        if block_context is None:
+            context['block'] = node
+            for chunk in _stream_nodelist(node.nodelist, context):
+                yield chunk
+        else:
+            push = block = block_context.pop(node.name)
+            if block is None:
+                block = node
+            block = type(node)(block.name, block.nodelist)
+            block.context = context
+            context['block'] = block
+            for chunk in _stream_nodelist(block.nodelist, context):
+                yield chunk
+            if push is not None:
+                block_context.push(node.name, push)
+
+
+def _stream_nodelist(nodelist, context):
+    for node in nodelist:
+        if isinstance(node, ExtendsNode):
+            chunks = _stream_extends(node, context)
+        elif type(node) is BlockNode:
+            chunks = _stream_block(node, context)
+        elif isinstance(node, Node):
+            chunks = [_render_node(nodelist, node, context)]
+        else:
+            chunks = [node]
+        for chunk in chunks:
+            chunk = force_text(chunk)
+            if chunk:
+                yield chunk
+
+
+def _stream_template(template, context):
+    # As in Template.render.
+    context.render_context.push()
+    try:
+        if getattr(context, 'template', False) is None:  # Django >= 1.8
+            with context.bind_template(template):
+                context.template_name = template.name
+                for chunk in _stream_nodelist(template.nodelist, context):
+                    yield chunk
+        else:
+            for chunk in _stream_nodelist(template.nodelist, context):
+                yield chunk
+    finally:
+        context.render_context.pop()
+
+
+def stream_template(template, context):
+    """
+    Render ``template`` (a django.template.base.Template) with ``context``
+    pedantically, yielding the output in chunks.
+    """
+    patches = strict_rendering()
+    chunks = _stream_template(template, context)
+    while True:
+        with patches:
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+        yield chunk
@@ -0,0 +1,352 @@
+"""
+Template coverage: which template lines and ``{% if %}`` branches ran.
+
+``start()`` patches django's template machinery to note every node rendered
+and every branch taken by ``{% if %}``/``{% ifdef %}``. The hot path only adds
+the node to a set; nodes are turned into (template, line) pairs in batches.
+The first time a template is rendered, all of its nodes and branches are
+registered so that unexecuted ones show up as missing.
+
+Each process saves its own data file (``<data_file>.<host>.<pid>.<random>``,
+as coverage.py does in parallel mode). ``combine()`` merges them into
+``<data_file>`` itself, and ``./manage.py pedant_coverage`` prints a report and
+can write coverage.py data for use with ``django_coverage_plugin``. As with
+coverage.py, ``erase()`` clears the data of earlier runs.
+
+Line numbers need Django >= 1.9, or TEMPLATE_DEBUG on earlier versions.
+"""
+import atexit
+import glob
+import json
+import os
+import random
+import socket
+import weakref
+
+import django
+from django.template.base import Node
+from django.template.base import NodeList
+from django.template.base import Template
+from django.template.base import TextNode
+from django.template.base import VariableDoesNotExist
+from django.template.defaulttags import IfNode
+
+from pedant.introspection import node_lineno
+from pedant.introspection import node_origin
+from pedant.introspection import template_name
+from pedant.patching import patch_object
+from pedant.patching import PatchSet
+
+DEFAULT_DATA_FILE = '.pedant-coverage'
+# Number of recorded nodes after which they are converted to line numbers.
+FLUSH_THRESHOLD = 10000
+COVERAGE_PY_FILE_TRACER = 'django_coverage_plugin.DjangoTemplatePlugin'
+
+
+def _branch_count(node):
+    conditions = node.conditions_nodelists
+    # Without an {% else %}, falling through is a branch of its own.
+    return len(conditions) + (conditions[-1][0] is not None)
+
+
+class TemplateCoverage(object):
+    """
+    Coverage data for templates, keyed by template name.
+
+    ``lines``/``branches`` hold everything that could run, ``executed`` and
+    ``taken`` what did. Branches are (line of the if tag, branch index).
+    """
+    def __init__(self):
+        self.lines = {}
+        self.executed = {}
+        self.branches = {}
+        self.taken = {}
+        self._nodes = set()
+        self._taken_nodes = set()
+        self._templates = weakref.WeakKeyDictionary()
+        # Templates built from strings only have a name on the Template, not
+        # on the origin their nodes point to.
+        self._origin_names = weakref.WeakKeyDictionary()
+
+    def _location(self, node):
+        origin = node_origin(node)
+        lineno = node_lineno(node)
+        if origin is None or lineno is None:
+            return None, None
+        return self._origin_names.get(origin) or template_name(origin), lineno
+
+    def register(self, template):
+        self._templates[template] = True
+        if template.name:
+            self._origin_names[template.origin] = template.name
+        for node in template.nodelist.get_nodes_by_type(Node):
+            if isinstance(node, TextNode):
+                continue
+            name, lineno = self._location(node)
+            if name is None:
+                continue
+            self.lines.setdefault(name, set()).add(lineno)
+            if isinstance(node, IfNode):
+                self.branches.setdefault(name, set()).update(
+                    (lineno, index) for index in range(_branch_count(node)))
+
+    def flush(self):
+        """
+        Convert the recorded nodes to template lines.
+        """
+        nodes, self._nodes = self._nodes, set()
+        for node in nodes:
+            name, lineno = self._location(node)
+            if name is not None and not isinstance(node, TextNode):
+                self.executed.setdefault(name, set()).add(lineno)
+        taken, self._taken_nodes = self._taken_nodes, set()
+        for node, index in taken:
+            name, lineno = self._location(node)
+            if name is not None:
+                self.taken.setdefault(name, set()).add((lineno, index))
+
+    def hit(self, node):
+        self._nodes.add(node)
+        if len(self._nodes) > FLUSH_THRESHOLD:
+            self.flush()
+
+    def take(self, node, index):
+        self._taken_nodes.add((node, index))
+
+    def update(self, other):
+        for attribute in ('lines', 'executed', 'branches', 'taken'):
+            mine = getattr(self, attribute)
+            for name, values in getattr(other, attribute).items():
+                mine.setdefault(name, set()).update(values)
+
+    def to_json(self):
+        self.flush()
+        return dict(
+            (attribute, dict((name, sorted(values))
+                             for name, values in
+                             getattr(self, attribute).items()))
+            for attribute in ('lines', 'executed', 'branches', 'taken'))
+
+    @classmethod
+    def from_json(cls, data):
+        result = cls()
+        for attribute in ('lines', 'executed', 'branches', 'taken'):
+            setattr(result, attribute, dict(
+                (name, set(tuple(v) if isinstance(v, list) else v
+                           for v in values))
+                for name, values in data.get(attribute, {}).items()))
+        return result
+
+    def save(self, data_file=DEFAULT_DATA_FILE, parallel=True):
+        """
+        Write this process's data to its own file next to ``data_file``, or
+        to ``data_file`` itself if ``parallel`` is false.
+        """
+        path = data_file
+        if parallel:
+            path = '%s.%s.%d.%06d' % (data_file, socket.gethostname(),
+                                      os.getpid(), random.randint(0, 999999))
+        with open(path, 'w') as f:
+            json.dump(self.to_json(), f)
+        return path
+
+    def report(self):
+        """
+        Return a text report of line and branch coverage per template.
+        """
+        self.flush()
+        rows = [('Template', 'Lines', 'Miss', 'Branch', 'BrMiss', 'Cover',
+                 'Missing')]
+        for name in sorted(set(self.lines) | set(self.executed)):
+            executed = self.executed.get(name, set())
+            lines = self.lines.get(name, set()) | executed
+            branches = (self.branches.get(name, set()) |
+                        self.taken.get(name, set()))
+            missing = sorted(lines - executed)
+            branches_missed = len(branches - self.taken.get(name, set()))
+            total = len(lines) + len(branches)
+            covered = total - len(missing) - branches_missed
+            rows.append((
+                name, str(len(lines)), str(len(missing)),
+                str(len(branches)), str(branches_missed),
+                '%d%%' % (100 * covered // total if total else 100),
+                ', '.join(str(line) for line in missing)))
+        widths = [max(len(row[i]) for row in rows) for i in range(6)]
+        return '\n'.join(
+            '  '.join([row[0].ljust(widths[0])] +
+                      [cell.rjust(width)
+                       for cell, width in zip(row[1:6], widths[1:])] +
+                      [row[6]]).rstrip()
+            for row in rows) + '\n'
+
+    def write_coverage_data(self, path):
+        """
+        Write executed lines as coverage.py data, for django_coverage_plugin.
+
+        Only templates with a file name are included. Requires coverage.py.
+        """
+        from coverage import CoverageData
+        self.flush()
+        lines = dict((name, sorted(executed))
+                     for name, executed in self.executed.items()
+                     if os.path.isabs(name))
+        tracers = dict((name, COVERAGE_PY_FILE_TRACER) for name in lines)
+        try:
+            data = CoverageData(basename=path)  # coverage >= 5
+        except TypeError:
+            data = CoverageData()
+            data.add_lines(dict(
+                (name, dict.fromkeys(executed))
+                for name, executed in lines.items()))
+            data.add_file_tracers(tracers)
+            data.write_file(path)
+        else:
+            data.add_lines(lines)
+            data.add_file_tracers(tracers)
+            data.write()
+
+
+def _parallel_files(data_file):
+    return glob.glob(data_file + '.*')
+
+
+def combine(data_file=DEFAULT_DATA_FILE, keep=False):
+    """
+    Merge the per-process files for ``data_file`` into one TemplateCoverage.
+
+    Data already combined into ``data_file`` is included. Unless ``keep`` is
+    true, the result is saved to ``data_file`` and the per-process files are
+    removed.
+    """
+    result = TemplateCoverage()
+    paths = _parallel_files(data_file)
+    for path in [data_file] + paths:
+        if path == data_file and not os.path.exists(path):
+            continue
+        with open(path) as f:
+            result.update(TemplateCoverage.from_json(json.load(f)))
+    if not keep and paths:
+        result.save(data_file, parallel=False)
+        for path in paths:
+            os.remove(path)
+    return result
+
+
+def erase(data_file=DEFAULT_DATA_FILE):
+    """
+    Remove the combined and per-process files for ``data_file``.
+
+    Call this once before a run, not from every process: other processes'
+    files would be removed too.
+    """
+    for path in [data_file] + _parallel_files(data_file):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+_active = None
+_patches = None
+_data_file = None
+
+
+def _render(self, context):
+    if self not in _active._templates:
+        _active.register(self)
+    return _original_render(self, context)
+
+
+_original_render = Template._render
+
+
+def _render_annotated(self, context):
+    _active.hit(self)
+    return _original_render_annotated(self, context)
+
+
+_original_render_annotated = getattr(Node, 'render_annotated', None)
+
+
+def _render_node(self, node, context):
+    _active.hit(node)
+    return _original_render_node(self, node, context)
+
+
+_original_render_node = getattr(NodeList, 'render_node', None)
+
+
+def _debug_render_node(self, node, context):
+    _active.hit(node)
+    return _original_debug_render_node(self, node, context)
+
+
+_original_debug_render_node = None
+
+
+def _if_node_render(self, context):
+    """
+    Like IfNode.render, but records which branch was taken.
+    """
+    for index, (condition, nodelist) in enumerate(
+            self.conditions_nodelists):
+        if condition is not None:           # if / elif clause
+            try:
+                match = condition.eval(context)
+            except VariableDoesNotExist:
+                match = None
+        else:                               # else clause
+            match = True
+
+        if match:
+            _active.take(self, index)
+            return nodelist.render(context)
+
+    _active.take(self, len(self.conditions_nodelists))
+    return ''
+
+
+def start(data_file=None):
+    """
+    Start measuring template coverage in this process.
+
+    If ``data_file`` is given, the data is saved next to it by ``stop()``, or
+    when the process exits.
+    """
+    global _active, _patches, _data_file, _original_debug_render_node
+    if _active is not None:
+        return _active
+    _active = TemplateCoverage()
+    patches = [
+        patch_object(Template, '_render', _render),
+        patch_object(IfNode, 'render', _if_node_render),
+    ]
+    if django.VERSION < (1, 9):
+        from django.template.debug import DebugNodeList
+        _original_debug_render_node = DebugNodeList.render_node
+        patches.append(patch_object(NodeList, 'render_node', _render_node))
+        patches.append(
+            patch_object(DebugNodeList, 'render_node', _debug_render_node))
+    else:
+        patches.append(
+            patch_object(Node, 'render_annotated', _render_annotated))
+    _patches = PatchSet(patches)
+    _patches.__enter__()
+    if data_file is not None and _data_file is None:
+        atexit.register(stop)
+    _data_file = data_file
+    return _active
+
+
+def stop():
+    """
+    Stop measuring and return the data collected.
+    """
+    global _active, _patches, _data_file
+    data = _active
+    if _patches is not None:
+        _patches.__exit__(None, None, None)
+    if data is not None:
+        data.flush()
+        if _data_file is not None:
+            data.save(_data_file)
+    _active = _patches = _data_file = None
+    return data
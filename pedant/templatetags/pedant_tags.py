@@ -7,24 +7,63 @@ import re
 from django.template import Library
 from django.template import TemplateSyntaxError
 from django.template.defaulttags import IfNode
-from django.template.smartif import IfParser, Literal
+from django.template.smartif import Literal
 
 register = Library()
 
 
 class IfDefLiteral(Literal):
+    def __init__(self, value):
+        super(IfDefLiteral, self).__init__(value)
+        self.lookups = value.split('.')
+
     def eval(self, context):
-        vars = self.value.split('.')
-        defined = vars[0] in context
-        if not defined:
+        if self.lookups[0] not in context:
             return False
-        evaluated = context[vars[0]]
-        for attr in vars[1:]:
+        evaluated = context[self.lookups[0]]
+        for attr in self.lookups[1:]:
             if hasattr(evaluated, attr):
                 evaluated = getattr(evaluated, attr)
             else:
                 return False
-        return defined
+        return True
+
+
+class IfDefCondition(object):
+    """
+    A compiled ifdef expression. ``eval`` is a single function that
+    short-circuits like Python's ``and``/``or``.
+    """
+    def __init__(self, expression, evaluate):
+        self.expression = expression
+        self.eval = evaluate
+
+    def __repr__(self):
+        return '(ifdef %s)' % self.expression
+
+
+def _all(operands):
+    def evaluate(context):
+        for operand in operands:
+            if not operand(context):
+                return False
+        return True
+    return evaluate
+
+
+def _any(operands):
+    def evaluate(context):
+        for operand in operands:
+            if operand(context):
+                return True
+        return False
+    return evaluate
+
+
+def _not(operand):
+    def evaluate(context):
+        return not operand(context)
+    return evaluate
 
 
 # Based on http://stackoverflow.com/a/10134719 This regexp will identify all
@@ -32,25 +71,66 @@ class IfDefLiteral(Literal):
 PYTHON_IDENTIFIER_REGEXP = re.compile(r'^([^\d\W]\w*[.]?)+\Z')
 
 
-class IfDefParser(IfParser):
+class IfDefParser(object):
+    """
+    Parse ``and``, ``or`` and ``not`` over identifiers, with Python's
+    precedence, into an IfDefCondition.
+    """
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
     def create_var(self, value):
         if not PYTHON_IDENTIFIER_REGEXP.match(value):
             raise TemplateSyntaxError('%r is not an identifier.' % value)
         return IfDefLiteral(value)
 
+    def parse(self):
+        evaluate = self.parse_operands('or', self.parse_and)
+        if self.position < len(self.tokens):
+            raise TemplateSyntaxError(
+                "Unused '%s' at end of ifdef expression." %
+                self.tokens[self.position])
+        return IfDefCondition(' '.join(self.tokens), evaluate)
+
+    def parse_operands(self, operator, parse_operand):
+        operands = [parse_operand()]
+        while (self.position < len(self.tokens) and
+               self.tokens[self.position] == operator):
+            self.position += 1
+            operands.append(parse_operand())
+        if len(operands) == 1:
+            return operands[0]
+        return _any(operands) if operator == 'or' else _all(operands)
+
+    def parse_and(self):
+        return self.parse_operands('and', self.parse_not)
+
+    def parse_not(self):
+        if self.position >= len(self.tokens):
+            raise TemplateSyntaxError(
+                'Unexpected end of expression in ifdef tag.')
+        token = self.tokens[self.position]
+        self.position += 1
+        if token == 'not':
+            return _not(self.parse_not())
+        if token in ('and', 'or'):
+            raise TemplateSyntaxError(
+                "Not expecting '%s' in this position in ifdef tag." % token)
+        return self.create_var(token).eval
+
 
 @register.tag
 def ifdef(parser, token):
     """
-    Check if variable is defined in the context.
+    Check if variables are defined in the context, e.g.
+    ``{% ifdef user.profile and not guest %}``.
 
     Similar to django.template.defaulttags.do_if.
     """
     block_tokens = ('elifdef', 'else', 'endifdef')
     # {% ifdef ... %}
     bits = token.split_contents()[1:]
-    if len(bits) > 1:
-        raise TemplateSyntaxError('%r is not an identifier.' % token)
     condition = IfDefParser(bits).parse()
     nodelist = parser.parse(block_tokens)
     conditions_nodelists = [(condition, nodelist)]
@@ -59,8 +139,6 @@ def ifdef(parser, token):
     # {% elifdef ... %} (repeatable)
     while token.contents.startswith('elifdef'):
         bits = token.split_contents()[1:]
-        if len(bits) > 1:
-            raise TemplateSyntaxError('%r is not an identifier.' % token)
         condition = IfDefParser(bits).parse()
         nodelist = parser.parse(block_tokens)
         conditions_nodelists.append((condition, nodelist))
@@ -0,0 +1,24 @@
+"""
+Test cases that render templates pedantically.
+
+These live apart from ``pedant.utils`` so that runtime code using pedant
+doesn't import ``django.test``; ``pedant.utils`` imports them on first use.
+"""
+from django.test import TestCase
+
+from pedant.decorators import fail_on_template_errors
+
+
+class PedanticTestCaseMixin(object):
+    """
+    Mixin that runs all tests in a TestCase with pedantic rendering.
+    """
+    @fail_on_template_errors
+    def run(self, *args, **kwargs):
+        super(PedanticTestCaseMixin, self).run(*args, **kwargs)
+
+
+class PedanticTestCase(PedanticTestCaseMixin, TestCase):
+    """
+    Django TestCase that runs all tests with pedantic rendering.
+    """
@@ -1,27 +1,77 @@
 import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
 from unittest import skipIf
 
 import django
+from django.core.management import call_command
+from django.core.management import CommandError
 from django.template import Library
 from django.template.base import Context
 from django.template.base import FilterExpression
 from django.template.base import Template
 from django.template.base import TemplateSyntaxError
+from django.utils.six import StringIO
+from django.http import HttpResponse
+from django.test import RequestFactory
 from django.test import TestCase
 from django.test.utils import override_settings
 from mock import Mock
 from mock import patch
 
+from pedant.allowlist import Allowlist
+from pedant.allowlist import suppressed_counts
+from pedant.cache_fragments import check_fragments
+from pedant.cache_fragments import fragment_checking
+from pedant.checker import check_all
+from pedant.checker import Problem
+from pedant.checker import TemplateWatcher
 from pedant.decorators import _fail_template_string_if_invalid
 from pedant.decorators import strict_resolve
 from pedant.decorators import _log_template_string_if_invalid
 from pedant.decorators import fail_on_template_errors
+from pedant.decorators import get_string_if_invalid
 from pedant.decorators import log_template_errors
 from pedant.decorators import patch_string_if_invalid
 from pedant.decorators import PedanticTemplateRenderingError
+from pedant.decorators import strict_rendering
+from pedant.filters import fail_on_filter_errors
+from pedant.filters import FilterStats
+from pedant.filters import filter_instrumentation
+from pedant.filters import install as install_filters
+from pedant.filters import log_filter_errors
+from pedant.footprint import measure
+from pedant.instrumentation import recording
+from pedant.metrics import CounterTable
+from pedant.metrics import get_table
+from pedant.metrics import KEY_SEPARATOR
+from pedant.metrics import render_text
+from pedant.metrics import TIMING
+from pedant.middleware import PedanticPanelMiddleware
+from pedant.middleware import PedanticTimingMiddleware
+from pedant.patching import patch_object
+from pedant.prefetching import log_prefetch_suggestions
+from pedant.prescan import find_undecodable
+from pedant.prefetching import tracing_relations
+from pedant.querysets import fail_on_repeated_queries
+from pedant.querysets import log_repeated_queries
+from pedant.snapshots import load
+from pedant.snapshots import REDACTED
+from pedant.snapshots import snapshot_files
+from pedant import benchmark
+from pedant import cost
+from pedant import includes
+from pedant import panel
+from pedant import render_many
+from pedant import template_coverage
+from pedant.testcases import PedanticTestCase
+from pedant.testcases import PedanticTestCaseMixin
 from pedant.utils import PedanticTemplate
-from pedant.utils import PedanticTestCase
-from pedant.utils import PedanticTestCaseMixin
+from pedant.utils import stream_pedantically
 
 
 def patch_builtins(library):
@@ -649,7 +699,7 @@ class TestIfDefTags(PedanticTestCase):
     def test_ifdef_disallows_non_identifier_expressions(self):
         with self.assertRaises(TemplateSyntaxError):
             Template(
-                "{% load pedant_tags %}\n{% ifdef a and b %}{% endifdef %}")
+                "{% load pedant_tags %}\n{% ifdef a == b %}{% endifdef %}")
 
     def test_ifdef_disallows_non_identifier_expressions_2(self):
         with self.assertRaises(TemplateSyntaxError):
@@ -659,7 +709,27 @@ class TestIfDefTags(PedanticTestCase):
     def test_elifdef_disallows_non_identifier_expressions(self):
         with self.assertRaises(TemplateSyntaxError):
             Template(
-                "{% load pedant_tags %}\n{% ifdef a %}{% elifdef a and b %}{% endifdef %}")  # nopep8
+                "{% load pedant_tags %}\n{% ifdef a %}{% elifdef a == b %}{% endifdef %}")  # nopep8
+
+    def test_ifdef_boolean_expressions(self):
+        ifdef_template = Template(
+            "{% load pedant_tags %}"
+            "{% ifdef a and not b or c.d %}yes{% else %}no{% endifdef %}")
+
+        class Foo(object):
+            d = 1
+
+        for context, expected in (
+                ({'a': 1}, 'yes'), ({'a': 1, 'b': 1}, 'no'),
+                ({'b': 1, 'c': Foo()}, 'yes'), ({'c': 1}, 'no'), ({}, 'no')):
+            self.assertEqual(ifdef_template.render(Context(context)),
+                             expected, context)
+
+    def test_ifdef_boolean_expressions_syntax(self):
+        for expression in ('a b', 'a and', 'or a', 'not', 'a and or b'):
+            with self.assertRaises(TemplateSyntaxError):
+                Template("{%% load pedant_tags %%}{%% ifdef %s %%}"
+                         "{%% endifdef %%}" % expression)
 
     def test_ifdef_follows_attributes(self):
         ifdef_template = Template(
@@ -679,3 +749,1328 @@ class TestIfDefTags(PedanticTestCase):
         self.assertEqual(
             ifdef_template.render(Context({'a': Foo(b=Foo(c=Foo()))})).strip(),
             'defined')
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'metrics')
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_tables_share_counters_through_the_file(self):
+        worker1 = CounterTable(self.path, slots=4)
+        worker2 = CounterTable(self.path, slots=4)
+        worker1.increment(u'a')
+        worker2.increment(u'a', elapsed=1.5)
+        worker2.increment(u'b')
+        self.assertEqual(sorted(worker1.items()),
+                         [(u'a', 2, 1.5), (u'b', 1, 0.0)])
+
+    def test_full_table_drops_updates(self):
+        table = CounterTable(self.path, slots=2)
+        for key in u'abc':
+            table.increment(key)
+        self.assertEqual(len(table.items()), 2)
+        self.assertEqual(table.dropped, 1)
+
+    def test_errors_are_recorded_and_exposed(self):
+        with self.settings(PEDANT_METRICS_FILE=self.path):
+            self.addCleanup(get_table().close)
+
+            @log_template_errors(Mock())
+            def render():
+                return Template('{{ a }}{{ a }}').render(Context())
+
+            render()
+            output = StringIO()
+            call_command('pedant_metrics', stdout=output)
+        self.assertIn(
+            u'pedant_template_errors_total{kind="unknown_variable",'
+            u'template="<unknown source>",variable="a"} 2',
+            output.getvalue())
+
+    def test_threads_do_not_lose_counts(self):
+        table = CounterTable(self.path, slots=4)
+        self.addCleanup(table.close)
+
+        def work():
+            for _ in range(5000):
+                table.increment(u'a')
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(table.items(), [(u'a', 40000, 0.0)])
+
+    def test_unusable_file_does_not_fail_rendering(self):
+        path = os.path.join(self.directory, 'missing', 'metrics')
+
+        @log_template_errors(Mock())
+        def render():
+            return Template('{{ a }}{{ a }}').render(Context())
+
+        with self.settings(PEDANT_METRICS_FILE=path), \
+                patch('pedant.metrics.logger') as logger, \
+                patch.dict('pedant.metrics._tables'):
+            self.assertEqual(render(), '')
+            render()
+            self.assertIsNone(get_table())
+        self.assertEqual(logger.exception.call_count, 1)
+
+    def test_no_stack_walk_without_metrics(self):
+        @log_template_errors(Mock())
+        def render():
+            return Template('{{ a }}').render(Context())
+
+        with patch('pedant.decorators.current_template_name') as name:
+            render()
+        self.assertFalse(name.called)
+
+    def test_families_are_grouped(self):
+        table = CounterTable(self.path, slots=8)
+        self.addCleanup(table.close)
+        for hook in (u'a', u'b'):
+            record = KEY_SEPARATOR.join([TIMING, hook])
+            table.increment(record, count=2, elapsed=0.5)
+        lines = render_text(table).splitlines()
+        families = [line.split()[2] if line.startswith('#') else
+                    line.split('{')[0].split()[0] for line in lines]
+        # Every sample follows the TYPE line of its own family.
+        current = None
+        for line, family in zip(lines, families):
+            if line.startswith('# TYPE'):
+                current = family
+            else:
+                self.assertEqual(family, current, line)
+
+
+@override_settings(PEDANT_INSTRUMENT=True)
+class TestInstrumentation(TestCase):
+    def test_hooks_are_timed(self):
+        @log_template_errors(Mock())
+        def render():
+            return Template('{{ a }}{{ b }}').render(Context({'b': 'b'}))
+
+        with recording() as timings:
+            render()
+        self.assertEqual(timings['strict_resolve'][0], 2)
+        self.assertEqual(timings['variable_node_render'][0], 2)
+        self.assertEqual(timings['log_invalid_variable'][0], 1)
+
+    @override_settings(PEDANT_INSTRUMENT=False)
+    def test_disabled(self):
+        @fail_on_template_errors
+        def render():
+            return Template('{{ a }}').render(Context({'a': 'a'}))
+
+        with recording() as timings:
+            render()
+        self.assertEqual(timings, {})
+
+    def test_middleware_sets_server_timing(self):
+        middleware = PedanticTimingMiddleware()
+        request = RequestFactory().get('/')
+
+        @fail_on_template_errors
+        def view(request):
+            return HttpResponse(Template('{{ a }}').render(Context({'a': 1})))
+
+        middleware.process_request(request)
+        response = middleware.process_response(request, view(request))
+        self.assertEqual(request.pedant_timings['strict_resolve'][0], 1)
+        self.assertIn('pedant-strict_resolve;dur=', response['Server-Timing'])
+
+
+class TestPatching(TestCase):
+    class Target(object):
+        attribute = 'class'
+
+    def test_restores_instance_attribute(self):
+        target = self.Target()
+        target.attribute = 'instance'
+        with patch_object(target, 'attribute', 'new'):
+            self.assertEqual(target.attribute, 'new')
+        self.assertEqual(target.attribute, 'instance')
+
+    def test_restores_inherited_attribute(self):
+        target = self.Target()
+        patcher = patch_object(target, 'attribute', 'new')
+        with patcher:
+            with patcher:
+                self.assertEqual(target.attribute, 'new')
+            self.assertEqual(target.attribute, 'new')
+        self.assertEqual(target.attribute, 'class')
+        self.assertNotIn('attribute', vars(target))
+
+    @override_settings(PEDANT_TEST_SETTING='original')
+    def test_restores_setting(self):
+        from django.conf import settings
+
+        @patch_object(settings, 'PEDANT_TEST_SETTING', 'new')
+        def read():
+            return settings.PEDANT_TEST_SETTING
+
+        self.assertEqual(read(), 'new')
+        self.assertEqual(settings.PEDANT_TEST_SETTING, 'original')
+
+
+class TestFootprint(TestCase):
+    def test_runtime_does_not_import_test_only_modules(self):
+        result = measure(
+            ['pedant.decorators', 'pedant.middleware', 'pedant.utils'])
+        self.assertIn('pedant.utils', result['modules'])
+        self.assertEqual(result['test_only_modules'], [])
+
+    def test_test_cases_can_be_imported_from_utils(self):
+        from pedant.utils import PedanticTestCase as FromUtils
+        from pedant.utils import PedanticTestCaseMixin as MixinFromUtils
+        self.assertIs(FromUtils, PedanticTestCase)
+        self.assertIs(MixinFromUtils, PedanticTestCaseMixin)
+
+    def test_decorators_import_few_modules(self):
+        # Raise this deliberately; e.g. django's cache framework is only
+        # imported when checking {% cache %} fragments.
+        result = measure(['pedant.decorators'])
+        self.assertLessEqual(len(result['modules']), 20, result['modules'])
+        self.assertNotIn('django.core.cache', result['modules'])
+
+
+PYTEST_CONFTEST = '''
+import os
+import django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings_test')
+django.setup()
+'''
+
+PYTEST_TESTS = '''
+import pytest
+from django.template import Context, Template
+
+
+def test_missing():
+    Template('{{ a }}').render(Context())
+
+
+@pytest.mark.pedant_log
+def test_logged():
+    assert Template('{{ b }}').render(Context()) == ''
+
+
+def test_logged_fixture(pedant_log):
+    Template('{{ c }}').render(Context())
+    assert len(pedant_log) == 1
+
+
+def test_clean():
+    Template('{{ a }}').render(Context({'a': 1}))
+'''
+
+
+class TestPytestPlugin(TestCase):
+    def run_pytest(self, *args):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for name, source in [('conftest.py', PYTEST_CONFTEST),
+                             ('test_templates.py', PYTEST_TESTS)]:
+            with open(os.path.join(directory, name), 'w') as f:
+                f.write(source)
+        environment = dict(
+            os.environ,
+            PYTHONPATH=os.pathsep.join(sys.path))
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'pytest', '-p', 'pedant.pytest_plugin',
+             '-p', 'no:cacheprovider', '--pedant-mode=strict'] + list(args),
+            cwd=directory, env=environment,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        return process.communicate()[0].decode('utf-8')
+
+    def assert_summary(self, output):
+        self.assertIn('1 failed, 3 passed', output)
+        self.assertIn('pedant template errors', output)
+        for name, variable in [('missing', 'a'), ('logged', 'b'),
+                               ('logged_fixture', 'c')]:
+            self.assertIn(
+                "test_templates.py::test_%s: 1\n"
+                "    Unknown template variable <Variable: u'%s'>" % (
+                    name, variable),
+                output)
+
+    def test_session(self):
+        self.assert_summary(self.run_pytest())
+
+    def test_xdist(self):
+        self.assert_summary(self.run_pytest('-n', '2'))
+
+    def test_coverage_runs_do_not_accumulate(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        data_file = os.path.join(directory, 'coverage')
+        for _ in range(2):
+            self.run_pytest('-n', '2', '--pedant-coverage=' + data_file)
+            self.assertEqual(os.listdir(directory), ['coverage'])
+
+
+@override_settings(DEBUG=True, TEMPLATE_DEBUG=True)
+class TestTemplateCoverage(TestCase):
+    source = (
+        '{% load pedant_tags %}\n'
+        '{{ title }}\n'
+        '{% if items %}\n'
+        '{% for item in items %}{{ item }}{% endfor %}\n'
+        '{% else %}\n'
+        '{{ empty }}\n'
+        '{% endif %}\n'
+        '{% ifdef footer %}{{ footer }}{% endifdef %}\n')
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data_file = os.path.join(self.directory, 'coverage')
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.addCleanup(template_coverage.stop)
+
+    def render(self, **context):
+        Template(self.source, name='page.html').render(Context(context))
+
+    def test_lines_and_branches(self):
+        template_coverage.start()
+        self.render(title='t', items=[1])
+        data = template_coverage.stop()
+        self.assertEqual(data.lines['page.html'], set([1, 2, 3, 4, 6, 8]))
+        self.assertEqual(data.executed['page.html'], set([1, 2, 3, 4, 8]))
+        self.assertEqual(data.branches['page.html'],
+                         set([(3, 0), (3, 1), (8, 0), (8, 1)]))
+        self.assertEqual(data.taken['page.html'], set([(3, 0), (8, 1)]))
+        self.assertIn('page.html      6     1       4       2    70%  6',
+                      data.report())
+
+    def test_combine_processes(self):
+        template_coverage.start(self.data_file)
+        self.render(title='t', items=[1])
+        template_coverage.stop()
+        template_coverage.start(self.data_file)
+        self.render(title='t', empty='e', footer='f')
+        template_coverage.stop()
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+        data = template_coverage.combine(self.data_file)
+        self.assertEqual(data.executed['page.html'],
+                         set([1, 2, 3, 4, 6, 8]))
+        self.assertEqual(data.taken['page.html'], data.branches['page.html'])
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+    def test_runs_do_not_accumulate(self):
+        template_coverage.start(self.data_file)
+        self.render(title='t', items=[1])
+        template_coverage.stop()
+        template_coverage.combine(self.data_file)
+        template_coverage.erase(self.data_file)
+        template_coverage.start(self.data_file)
+        self.render(title='t', empty='e')
+        template_coverage.stop()
+
+        data = template_coverage.combine(self.data_file)
+        self.assertEqual(data.executed['page.html'], set([1, 2, 3, 6, 8]))
+        self.assertEqual(os.listdir(self.directory), ['coverage'])
+        # Combining again reads the merged data back.
+        self.assertEqual(
+            template_coverage.combine(self.data_file).executed, data.executed)
+
+    def test_command_writes_coverage_py_data(self):
+        from coverage import CoverageData
+        template_coverage.start(self.data_file)
+        Template('{{ a }}', name='/templates/a.html').render(
+            Context({'a': 1}))
+        template_coverage.stop()
+        output = StringIO()
+        coverage_data = os.path.join(self.directory, '.coverage')
+        call_command('pedant_coverage', self.data_file, stdout=output,
+                     coverage_data=coverage_data)
+        self.assertIn('/templates/a.html', output.getvalue())
+        data = CoverageData(basename=coverage_data)
+        data.read()
+        self.assertEqual(data.lines('/templates/a.html'), [1])
+
+
+class TestRepeatedQueries(TestCase):
+    template = Template(
+        '{% if items.exists %}\n'
+        '{% for item in items %}{{ item.model }}{% endfor %}\n'
+        '{{ items.count }}\n'
+        '{% endif %}', name='items.html')
+
+    def context(self):
+        from django.contrib.contenttypes.models import ContentType
+        return Context({'items': ContentType.objects.all()})
+
+    def test_fail(self):
+        @fail_on_repeated_queries
+        def render():
+            return self.template.render(self.context())
+
+        with self.assertRaises(PedanticTemplateRenderingError) as assertion:
+            render()
+        self.assertEqual(
+            str(assertion.exception),
+            'QuerySet for ContentType hit the database 2 times in one '
+            'render: exists() at items.html:1, evaluation at items.html:2')
+
+    def test_log(self):
+        logger = Mock()
+
+        @log_repeated_queries(logger)
+        def render():
+            return self.template.render(self.context())
+
+        render()
+        self.assertEqual(logger.log.call_count, 1)
+
+    def test_non_ascii_filters(self):
+        from django.contrib.contenttypes.models import ContentType
+        template = Template('{{ items.exists }}{{ items.count }}')
+        logger = Mock()
+
+        @log_repeated_queries(logger)
+        def render():
+            return template.render(Context(
+                {'items': ContentType.objects.filter(model=u'caf\xe9')}))
+
+        render()
+        self.assertEqual(logger.log.call_count, 1)
+
+    def test_unkeyable_queries_are_ignored(self):
+        @fail_on_repeated_queries
+        def render():
+            return self.template.render(self.context())
+
+        with patch('django.db.models.sql.query.Query.sql_with_params',
+                   side_effect=RuntimeError):
+            render()
+
+    def test_cached_results_are_not_repeats(self):
+        template = Template(
+            '{% if items %}{% for i in items %}{% endfor %}'
+            '{{ items.count }}{% endif %}')
+
+        @fail_on_repeated_queries
+        def render():
+            return template.render(self.context())
+
+        render()
+
+    def test_each_render_is_checked_separately(self):
+        template = Template('{{ items.count }}')
+
+        @fail_on_repeated_queries
+        def render():
+            context = self.context()
+            template.render(context)
+            template.render(context)
+
+        render()
+
+
+class TestPrefetchSuggestions(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import Group
+        from django.contrib.auth.models import Permission
+        group = Group.objects.create(name='group')
+        group.permissions.add(*Permission.objects.all()[:2])
+
+    def test_select_related(self):
+        from django.contrib.auth.models import Permission
+        template = Template(
+            '{% for p in permissions %}{{ p.content_type.app_label }}'
+            '{% endfor %}')
+        with tracing_relations() as trace:
+            template.render(Context({
+                'permissions': Permission.objects.all()}))
+        self.assertEqual(trace.suggestions(), [
+            ('permissions', Permission, ['content_type'], [])])
+
+    def test_existing_lookups_are_not_suggested(self):
+        from django.contrib.auth.models import Permission
+        template = Template(
+            '{% for p in permissions %}{{ p.content_type.app_label }}'
+            '{% endfor %}')
+        with tracing_relations() as trace:
+            template.render(Context({
+                'permissions': Permission.objects.select_related(
+                    'content_type')}))
+        self.assertEqual(trace.suggestions(), [])
+
+    def test_traces_through_strict_rendering(self):
+        from django.contrib.auth.models import Permission
+        template = Template(
+            '{% for p in permissions %}{{ p.content_type.app_label }}'
+            '{% endfor %}')
+        with tracing_relations() as trace:
+            with strict_rendering():
+                template.render(Context({
+                    'permissions': Permission.objects.all()}))
+        self.assertEqual(trace.suggestions(), [
+            ('permissions', Permission, ['content_type'], [])])
+
+    def test_prefetch_through_related_manager(self):
+        from django.contrib.auth.models import Group
+        template = Template(
+            '{% for group in groups %}'
+            '{% for p in group.permissions.all %}{{ p.content_type.model }}'
+            '{% endfor %}{% endfor %}')
+        logger = Mock()
+
+        @log_prefetch_suggestions(logger)
+        def view():
+            return template.render(Context({'groups': Group.objects.all()}))
+
+        view()
+        logger.log.assert_called_once_with(
+            logging.INFO, '%s: %s', 'view',
+            "groups (Group): .prefetch_related("
+            "'permissions__content_type')")
+
+
+class TestCacheFragments(TestCase):
+    template = Template(
+        '{% load cache %}{% cache 60 sidebar user.pk %}\n'
+        '{{ user.username }} {{ cart.total }}\n'
+        '{% for item in items %}{{ item }}{% endfor %}\n'
+        '{% endcache %}', name='sidebar.html')
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def context(self):
+        return Context({'user': {'pk': 1, 'username': 'u'},
+                        'cart': {'total': 2}, 'items': [1]})
+
+    def test_static(self):
+        self.assertEqual(check_fragments(self.template, 'sidebar.html'), [
+            (2, "{% cache %} fragment 'sidebar' at sidebar.html:1 uses "
+                "'cart', which is not one of its vary-on arguments"),
+            (3, "{% cache %} fragment 'sidebar' at sidebar.html:1 uses "
+                "'items', which is not one of its vary-on arguments"),
+        ])
+
+    def test_static_ignores_names_bound_inside(self):
+        template = Template(
+            '{% load cache %}{% cache 60 f key %}'
+            '{% with key.a as a %}{{ a }}{% endwith %}'
+            '{% for x in key.b %}{{ x }}{{ forloop.counter }}{% endfor %}'
+            '{% endcache %}')
+        self.assertEqual(check_fragments(template, 'f.html'), [])
+
+    @override_settings(PEDANT_CACHE_VARY_ON_IGNORE=['cart', 'items'])
+    def test_ignore_setting(self):
+        self.assertEqual(check_fragments(self.template, 'sidebar.html'), [])
+
+    def test_fail(self):
+        @fail_on_template_errors
+        def render():
+            return self.template.render(self.context())
+
+        with self.assertRaises(PedanticTemplateRenderingError) as assertion:
+            render()
+        self.assertEqual(
+            str(assertion.exception),
+            "{% cache %} fragment 'sidebar' at sidebar.html:1 uses 'cart', "
+            "which is not one of its vary-on arguments")
+
+    def test_log(self):
+        logger = Mock()
+
+        @log_template_errors(logger)
+        def render():
+            return self.template.render(self.context())
+
+        self.assertEqual(render().split(), ['u', '2', '1'])
+        self.assertEqual(
+            [c[0][1].split()[8] for c in logger.log.call_args_list],
+            ["'cart',", "'items',"])
+
+    def test_included_templates_are_checked(self):
+        template = Template(
+            '{% load cache %}{% cache 60 f included %}{% include included %}'
+            '{% endcache %}', name='f.html')
+
+        @fail_on_template_errors
+        def render():
+            return template.render(Context({
+                'included': Template('{{ cart.total }}'), 'cart': {}}))
+
+        with self.assertRaises(PedanticTemplateRenderingError):
+            render()
+
+    def test_only_cache_tags_are_patched(self):
+        resolve = FilterExpression.__dict__['resolve']
+        with fragment_checking(Mock()):
+            self.assertIs(FilterExpression.__dict__['resolve'], resolve)
+
+    def test_isolated_includes_are_not_followed(self):
+        template = Template(
+            '{% load cache %}{% cache 60 f included %}'
+            '{% include included only %}{% endcache %}', name='f.html')
+        on_mismatch = Mock()
+        with fragment_checking(on_mismatch):
+            template.render(Context({
+                'included': Template('{{ cart.total }}'), 'cart': {}}))
+        self.assertFalse(on_mismatch.called)
+
+    def test_check_command(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        good = os.path.join(directory, 'good.html')
+        bad = os.path.join(directory, 'bad.html')
+        with open(good, 'w') as f:
+            f.write('{% load cache %}{% cache 60 f a %}{{ a }}{% endcache %}')
+        with open(bad, 'w') as f:
+            f.write('{% if %}')
+        self.assertEqual([problem.template for problem in check_all(
+            [good, bad])], [bad])
+        stdout = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('pedant_check', good, bad, stdout=stdout)
+        self.assertTrue(stdout.getvalue().startswith(
+            bad + ':?: does not compile: '))
+        call_command('pedant_check', good, stdout=stdout)
+
+
+class TestBenchmark(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.template = os.path.join(self.directory, 'list.html')
+        with open(self.template, 'w') as f:
+            f.write('{% for i in items %}{{ i }}{% endfor %}')
+        self.baseline = os.path.join(self.directory, 'baseline.json')
+
+    def test_run(self):
+        recorded = os.path.join(self.directory, 'context.json')
+        with open(recorded, 'w') as f:
+            f.write('{"items": [1, 2]}')
+        results = benchmark.run({self.template: [
+            {'items': [1]}, recorded, lambda: {'items': []}]}, rounds=3)
+        self.assertEqual(results[self.template]['rounds'], 9)
+        stats = results[self.template]
+        self.assertTrue(0 < stats['median'] <= stats['p90'] <= stats['p99'])
+
+    def test_renders_pedantically(self):
+        with self.assertRaises(PedanticTemplateRenderingError):
+            benchmark.run({self.template: {}}, rounds=1)
+
+    def test_strict_mode_is_entered_once(self):
+        with patch('pedant.benchmark.strict_rendering',
+                   wraps=strict_rendering) as strict:
+            benchmark.time_renders(benchmark.load_template(self.template),
+                                   [{'items': [1]}, {'items': []}], rounds=3)
+        self.assertEqual(strict.call_count, 1)
+
+    def test_uses_template_loaders(self):
+        # Without resetting the engines, which other tests' templates use.
+        if django.VERSION < (1, 8):
+            patcher = override_settings(TEMPLATE_DIRS=[self.directory])
+        else:
+            from django.template.engine import Engine
+            patcher = patch.object(
+                Engine.get_default(), 'dirs', [self.directory])
+        with patcher:
+            results = benchmark.run({'list.html': {'items': [1]}}, rounds=1)
+        self.assertEqual(results['list.html']['rounds'], 1)
+
+    def test_regressions(self):
+        baseline = {'a': {'median': 1.0}, 'b': {'median': 1.0}}
+        results = {'a': {'median': 1.1}, 'b': {'median': 1.5},
+                   'c': {'median': 9.0}}
+        self.assertEqual(benchmark.regressions(results, baseline, 1.25),
+                         [('b', 1.0, 1.5)])
+
+    def test_command(self):
+        stdout = StringIO()
+        with override_settings(PEDANT_BENCHMARKS={
+                self.template: {'items': [1]}}):
+            call_command('pedant_benchmark', baseline=self.baseline,
+                         rounds=5, save=True, stdout=stdout)
+            saved = benchmark.load_baseline(self.baseline)
+            self.assertEqual(list(saved), [self.template])
+            saved[self.template]['median'] = 1e-9
+            benchmark.save_baseline(saved, self.baseline)
+            with self.assertRaises(CommandError):
+                call_command('pedant_benchmark', baseline=self.baseline,
+                             rounds=5, stdout=stdout)
+
+
+class TestRenderMany(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with open(os.path.join(directory, 'email.txt'), 'w') as f:
+            f.write('Dear {{ name }}')
+        with open(os.path.join(directory, 'fallback.txt'), 'w') as f:
+            f.write('Dear {{ name|default:fallback }}')
+        settings = override_settings(TEMPLATE_DIRS=[directory])
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.contexts = [{'name': 'a'}, {}, {'name': 'c'}]
+
+    def assertResults(self, results):
+        results = list(results)
+        self.assertEqual([result.output for result in results],
+                         ['Dear a', None, 'Dear c'])
+        self.assertEqual([type(result.error) for result in results],
+                         [type(None), PedanticTemplateRenderingError,
+                          type(None)])
+
+    def test_in_process(self):
+        self.assertResults(render_many('email.txt', self.contexts, workers=1))
+
+    def test_workers(self):
+        self.assertResults(render_many(
+            'email.txt', iter(self.contexts), workers=2, chunksize=1))
+
+    def test_errors_that_do_not_unpickle(self):
+        # VariableDoesNotExist pickles, but doesn't unpickle.
+        results = list(render_many(
+            'fallback.txt', [{'name': 'a', 'fallback': 'b'}, {'name': 'a'}],
+            workers=2, chunksize=1))
+        self.assertEqual(results[0], ('Dear a', None))
+        self.assertIsInstance(results[1].error, PedanticTemplateRenderingError)
+        self.assertTrue(str(results[1].error).startswith(
+            'VariableDoesNotExist: '))
+        self.assertIn('Traceback', results[1].error.traceback)
+
+    def test_results_are_yielded_as_rendered(self):
+        results = render_many('email.txt', iter(self.contexts), workers=2,
+                              chunksize=1)
+        self.assertEqual(next(results), ('Dear a', None))
+        results.close()
+
+
+class TestStreaming(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        templates = {
+            'base.html': '<h1>{{ title }}</h1>{% block content %}base '
+                         '{% block inner %}inner{% endblock %}{% endblock %}'
+                         '<footer>',
+            'page.html': '{% extends "base.html" %}{% block content %}'
+                         '{{ block.super }}{% for i in items %}{{ i }}'
+                         '{% endfor %}{{ items|length }}{% endblock %}',
+        }
+        for name, source in templates.items():
+            with open(os.path.join(directory, name), 'w') as f:
+                f.write(source)
+        settings = override_settings(TEMPLATE_DIRS=[directory])
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_chunks(self):
+        from django.template.loader import render_to_string
+        context = {'title': 'T', 'items': [1, 2]}
+        chunks = list(stream_pedantically('page.html', context))
+        self.assertEqual(
+            chunks, ['<h1>', 'T', '</h1>', 'base inner', '12', '2',
+                     '<footer>'])
+        self.assertEqual(''.join(chunks),
+                         render_to_string('page.html', context))
+
+    def test_stops_at_error(self):
+        chunks = stream_pedantically('page.html', {'items': []})
+        self.assertEqual(next(chunks), '<h1>')
+        with self.assertRaises(PedanticTemplateRenderingError):
+            next(chunks)
+        # Rendering is only strict while the stream renders a chunk.
+        self.assertEqual(Template('{{ a }}').render(Context()), '')
+
+    def test_streaming_response(self):
+        from django.http import StreamingHttpResponse
+        response = StreamingHttpResponse(stream_pedantically(
+            'page.html', {'title': 'T', 'items': []},
+            RequestFactory().get('/')))
+        self.assertEqual(b''.join(response.streaming_content),
+                         b'<h1>T</h1>base inner0<footer>')
+
+
+class TestSnapshots(TestCase):
+    def setUp(self):
+        self.template = Template(
+            '{% for o in orders %}{{ o.total }}{{ o.missing }}{% endfor %}'
+            '{{ user.name }}{{ name }}', name='orders.html')
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings = override_settings(PEDANT_SNAPSHOT_DIR=self.directory,
+                                     PEDANT_SNAPSHOT_SIZE=2)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def render(self, template, context):
+        @log_template_errors(Mock())
+        def render():
+            return template.render(Context(context))
+        return render()
+
+    def test_snapshot(self):
+        class Order(object):
+            def __init__(self, total):
+                self.total = total
+                self.api_key = 'secret'
+        self.render(self.template, {
+            'orders': [Order(1), Order(2)], 'user': {'name': 'n'},
+            'password': 'p', 'name': b'caf\xc3'})
+        snapshots = dict((snapshot['kind'], snapshot) for snapshot in map(
+            load, snapshot_files(self.directory)))
+        self.assertEqual(sorted(snapshots),
+                         ['unicode_decode_error', 'unknown_variable'])
+        snapshot = snapshots['unknown_variable']
+        self.assertEqual(snapshot['template'], 'orders.html')
+        self.assertEqual(snapshot['count'], 2)
+        self.assertIn("'o.missing'", snapshot['error'])
+        context = snapshot['context']
+        self.assertEqual(context['orders'], [
+            {'total': 1, 'api_key': REDACTED},
+            {'total': 2, 'api_key': REDACTED}])
+        self.assertEqual(context['password'], REDACTED)
+        self.assertEqual(context['name'], b'caf\xc3')
+
+    def test_values_that_do_not_convert_to_text(self):
+        class Broken(object):
+            __slots__ = ()
+
+            def __unicode__(self):
+                raise ValueError
+            __str__ = __unicode__
+        self.render(Template('{{ x }}'), {b'caf\xc3': 1, 'broken': Broken()})
+        context = load(snapshot_files(self.directory)[0])['context']
+        self.assertEqual(context[u'caf\ufffd'], 1)
+        self.assertIn('Broken object', context['broken'])
+
+    def test_snapshot_failures_are_logged(self):
+        with patch('pedant.snapshots.SnapshotBuffer.add',
+                   side_effect=ValueError), patch(
+                'pedant.snapshots.logger') as logger:
+            self.assertEqual(self.render(Template('{{ x }}y'), {}), 'y')
+        self.assertEqual(logger.exception.call_count, 1)
+
+    def test_ring_buffer(self):
+        for name in ['a', 'b', 'c']:
+            self.render(Template('{{ x }}', name=name), {})
+        self.assertEqual(sorted(load(path)['template'] for path in
+                                snapshot_files(self.directory)), ['b', 'c'])
+
+    def test_replay_command(self):
+        self.render(self.template, {'orders': [{'total': 1}]})
+        stdout = StringIO()
+        call_command('pedant_replay', stdout=stdout)
+        self.assertIn(
+            'orders.html (1 times, originally Unknown template variable ',
+            stdout.getvalue())
+        self.assertIn("reproduced: PedanticTemplateRenderingError: "
+                      "Unknown template variable", stdout.getvalue())
+
+
+class TestAllowlist(TestCase):
+    rules = [('legacy/*', '*'),
+             ('*', 'user.profile.*', 'unknown_variable'),
+             ('*', 'name', 'unicode_decode_error')]
+
+    def test_match(self):
+        allowlist = Allowlist(self.rules)
+        template_name = Mock(return_value='legacy/a.html')
+        self.assertEqual(
+            allowlist.match('unknown_variable', 'x', template_name), 0)
+        template_name.return_value = 'b.html'
+        self.assertEqual(allowlist.match(
+            'unknown_variable', 'user.profile.age', template_name), 1)
+        self.assertEqual(allowlist.match(
+            'unicode_decode_error', 'user.profile.age', template_name), None)
+        self.assertEqual(
+            allowlist.match('unknown_variable', 'user.name', template_name),
+            None)
+        # The template is only looked up when a rule needs it.
+        template_name.reset_mock()
+        self.assertEqual(Allowlist(self.rules[1:]).match(
+            'unicode_decode_error', 'name', template_name), 1)
+        self.assertEqual(template_name.call_count, 0)
+
+    def test_suppressed_errors_are_counted_not_logged(self):
+        template = Template('{{ a }}{{ user.profile.age }}{{ name }}b',
+                            name='b.html')
+        logger = Mock()
+
+        @log_template_errors(logger)
+        def render():
+            return template.render(Context({'name': b'caf\xc3'}))
+
+        # A new list, so that the counts start from zero.
+        with override_settings(PEDANT_ALLOWLIST=list(self.rules)):
+            self.assertEqual(render(), 'b')
+            self.assertEqual(logger.log.call_count, 1)
+            self.assertEqual([count for _, count in suppressed_counts()],
+                             [0, 1, 1])
+
+    def test_strict(self):
+        template = Template('{{ user.profile.age }}{{ name }}')
+
+        @fail_on_template_errors
+        def render():
+            return template.render(Context({'name': b'caf\xc3'}))
+
+        with override_settings(PEDANT_ALLOWLIST=self.rules):
+            self.assertEqual(render(), '')
+
+
+class TestPrescan(TestCase):
+    def setUp(self):
+        class User(object):
+            name = None
+        user = User()
+        user.name = b'\xff'
+        self.template = Template('{{ a }}{% include inner %}')
+        self.context = {
+            'inner': Template('{{ b }}'), 'a': 'ok',
+            'orders': [{'name': b'caf\xc3'}, {'name': 'ok'}], 'user': user}
+
+    def test_find(self):
+        self.assertEqual(find_undecodable(self.context), [
+            ('orders.0.name', b'caf\xc3'), ('user.name', b'\xff')])
+        self.assertEqual(find_undecodable(self.context, max_depth=2),
+                         [('user.name', b'\xff')])
+
+    def test_undecodable_keys(self):
+        self.assertEqual(find_undecodable({'d': {b'\xff': b'\xfe'}}),
+                         [(u'd.\ufffd', b'\xfe')])
+
+    def test_max_items_bounds_the_walk(self):
+        class Items(list):
+            taken = 0
+
+            def __iter__(self):
+                for item in list.__iter__(self):
+                    self.taken += 1
+                    yield item
+        items = Items([b'\xff'] * 1000)
+        self.assertEqual(
+            len(find_undecodable({'items': items}, max_items=10)), 9)
+        self.assertEqual(items.taken, 9)
+
+    def test_fail(self):
+        @fail_on_template_errors
+        def render():
+            return self.template.render(Context(self.context))
+
+        with override_settings(PEDANT_PRESCAN=True):
+            with self.assertRaises(PedanticTemplateRenderingError) as e:
+                render()
+        self.assertEqual(
+            str(e.exception),
+            "Undecodable bytestring in the context at orders.0.name: "
+            "'caf\\xc3'; "
+            "Undecodable bytestring in the context at user.name: '\\xff'")
+
+    def test_log(self):
+        logger = Mock()
+
+        @log_template_errors(logger)
+        def render():
+            return self.template.render(Context(self.context))
+
+        with override_settings(PEDANT_PRESCAN=True,
+                               PEDANT_ALLOWLIST=[('*', 'user.*')]):
+            render()
+        self.assertEqual(logger.log.call_count, 2)  # orders.0.name and b
+
+    def test_off_by_default(self):
+        @fail_on_template_errors
+        def render():
+            return self.template.render(Context(self.context))
+
+        with self.assertRaises(PedanticTemplateRenderingError) as e:
+            render()
+        self.assertIn("'b'", str(e.exception))
+
+
+class TestTemplateWatcher(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.write('base.html', '{% block body %}{% endblock %}')
+        self.write('page.html', '{% extends "base.html" %}'
+                                '{% block body %}{% include "row.html" %}'
+                                '{% endblock %}')
+        self.write('row.html', 'row')
+        self.write('other.html', '{% include name %}')
+        self.watcher = TemplateWatcher([self.directory])
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def write(self, name, source):
+        with open(self.path(name), 'w') as f:
+            f.write(source)
+        # Make sure the change is seen, even with coarse mtimes.
+        mtime = getattr(self, 'mtime', 1000000000) + 1
+        os.utime(self.path(name), (mtime, mtime))
+        self.mtime = mtime
+
+    def test_first_poll_checks_everything(self):
+        self.assertEqual(
+            sorted(self.watcher.poll()),
+            [self.path(name) for name in
+             ['base.html', 'other.html', 'page.html', 'row.html']])
+        self.assertEqual(self.watcher.poll(), {})
+
+    def test_dependents_are_rechecked(self):
+        self.watcher.poll()
+        self.write('row.html', 'new row')
+        self.assertEqual(sorted(self.watcher.poll()),
+                         [self.path('page.html'), self.path('row.html')])
+        self.write('base.html', 'new base')
+        self.assertEqual(sorted(self.watcher.poll()),
+                         [self.path('base.html'), self.path('page.html')])
+
+    def test_missing_and_broken_templates(self):
+        self.watcher.poll()
+        os.remove(self.path('row.html'))
+        self.assertEqual(self.watcher.poll(), {self.path('page.html'): [
+            Problem(self.path('page.html'), 1,
+                    "include 'row.html', which is not in the template "
+                    "directories")]})
+        self.write('base.html', '{% if %}')
+        [problem] = self.watcher.poll()[self.path('base.html')]
+        self.assertTrue(problem.message.startswith('does not compile'))
+        self.write('row.html', 'row')
+        self.assertEqual(self.watcher.poll()[self.path('page.html')], [])
+
+
+class TestFilterInstrumentation(TestCase):
+    def render(self, source, **context):
+        return Template(source, name='t.html').render(Context(context))
+
+    def test_swallowed_exception(self):
+        problems = []
+        with filter_instrumentation(problems.append, FilterStats()):
+            self.render('{{ d|date:"Y" }}', d='not a date')
+        self.assertEqual(problems, [
+            "Filter 'date' swallowed AttributeError for 'not a date' in "
+            "t.html"])
+
+    def test_fallbacks_are_not_problems(self):
+        problems = []
+        with filter_instrumentation(problems.append, FilterStats()):
+            self.assertEqual(self.render('{{ a|add:"x" }}', a='a'), 'ax')
+            self.assertEqual(self.render(
+                '{{ first|add:" "|add:last }}', first='A', last='B'), 'A B')
+            self.assertEqual(self.render(
+                '{{ items|pluralize }}{{ one|pluralize }}', items=[1, 2],
+                one=[1]), 's')
+            self.assertEqual(self.render('{{ n|default:"" }}', n=0), '')
+        self.assertEqual(problems, [])
+
+    def test_empty_result(self):
+        problems = []
+        with filter_instrumentation(problems.append, FilterStats()):
+            self.render('{{ s|slugify }}{{ b|striptags }}{{ e|lower }}',
+                        s='!', b='<b></b>', e='')
+        self.assertEqual(problems, [
+            "Filter 'slugify' returned an empty value for '!' in t.html"])
+        problems = []
+        with override_settings(PEDANT_FILTER_EMPTY_OK=['slugify']):
+            with filter_instrumentation(problems.append, FilterStats()):
+                self.render('{{ s|slugify }}', s='!')
+        self.assertEqual(problems, [])
+
+    def test_impure_filters_are_called_once(self):
+        register = Library()
+        calls = []
+
+        @register.filter(name='record')
+        def record(value):
+            calls.append(value)
+            return ''
+
+        problems = []
+        with patch_builtins(register):
+            with filter_instrumentation(problems.append, FilterStats()):
+                self.render('{{ v|record }}', v='x')
+        self.assertEqual(calls, ['x'])
+        self.assertEqual(problems, [
+            "Filter 'record' returned an empty value for 'x' in t.html"])
+
+    def test_fail_and_log(self):
+        @fail_on_filter_errors
+        def render():
+            return self.render('{{ a|add:1 }}', a=[1])
+
+        with self.assertRaises(PedanticTemplateRenderingError):
+            render()
+
+        logger = Mock()
+
+        @log_filter_errors(logger, logging.INFO)
+        def render():
+            return self.render('{{ d|date:"Y" }}{{ a|add:1 }}', d='x', a=1)
+
+        self.assertEqual(render(), '2')
+        logger.log.assert_called_once_with(
+            logging.INFO, "Filter 'date' swallowed AttributeError for 'x' "
+                          "in t.html")
+
+    def test_stats(self):
+        stats = FilterStats()
+        with filter_instrumentation(lambda message: None, stats):
+            template = Template('{% for i in items %}{{ i|add:1 }}'
+                                '{% endfor %}', name='loop.html')
+            template.render(Context({'items': [1, 2, 3]}))
+        template.render(Context({'items': [1, 2, 3]}))  # Not counted
+        self.assertEqual(stats.filters['add'][0], 3)
+        self.assertEqual(stats.templates['loop.html', 'add'][0], 3)
+        self.assertIn('loop.html  add', stats.report())
+
+    def test_filters_are_wrapped_once(self):
+        install_filters()
+        # Compiled before instrumentation starts.
+        template = Template('{{ a|add:1 }}', name='t.html')
+        original_render = Template.__dict__['render']
+        stats = FilterStats()
+        first = filter_instrumentation(lambda message: None, stats)
+        second = filter_instrumentation(lambda message: None, stats)
+        # As with overlapping requests.
+        first.__enter__()
+        second.__enter__()
+        first.__exit__(None, None, None)
+        template.render(Context({'a': 1}))
+        second.__exit__(None, None, None)
+        self.assertEqual(stats.templates['t.html', 'add'][0], 1)
+        self.assertIs(Template.__dict__['render'], original_render)
+
+
+class TestIncludes(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        os.mkdir(os.path.join(directory, 'rows'))
+        for name, source in (('a.html', 'a'), ('b.html', '{{ missing }}'),
+                             ('c.html', '{{ row.boom }}')):
+            with open(os.path.join(directory, 'rows', name), 'w') as f:
+                f.write(source)
+        # Without resetting the engines, which other tests' templates use.
+        if django.VERSION < (1, 8):
+            settings = override_settings(TEMPLATE_DIRS=[directory],
+                                         TEMPLATE_DEBUG=False)
+            settings.enable()
+            self.addCleanup(settings.disable)
+        else:
+            from django.template.engine import Engine
+            patcher = patch.multiple(Engine.get_default(), dirs=[directory],
+                                     debug=False)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    # Earlier versions only know line numbers with TEMPLATE_DEBUG.
+    missing = ("{%% include n %%} at %s loads 'rows/x.html', which does not "
+               "exist" % ('list.html:1' if django.VERSION >= (1, 9) else
+                          'list.html'))
+
+    def render(self, names):
+        template = Template('{% for n in names %}{% include n %}{% endfor %}',
+                            name='list.html')
+        return template.render(Context({'names': names}))
+
+    def test_fail(self):
+        @fail_on_template_errors
+        def render(names):
+            return self.render(names)
+
+        self.assertEqual(render(['rows/a.html']), 'a')
+        with self.assertRaises(PedanticTemplateRenderingError) as e:
+            render(['rows/a.html', 'rows/x.html'])
+        self.assertEqual(str(e.exception), self.missing)
+        # Django would render errors of included templates as ''.
+        with self.assertRaises(PedanticTemplateRenderingError) as e:
+            render(['rows/b.html'])
+        self.assertIn("'missing'", str(e.exception))
+
+    def test_log_and_cache(self):
+        logger = Mock()
+
+        @log_template_errors(logger)
+        def render(names):
+            return self.render(names)
+
+        with patch('pedant.includes._load',
+                   Mock(wraps=includes._load)) as load:
+            self.assertEqual(render(['rows/a.html', 'rows/x.html'] * 3),
+                             'aaa')
+        self.assertEqual(load.call_count, 2)
+        self.assertEqual(logger.log.call_count, 3)
+        logger.log.assert_called_with(logging.ERROR, self.missing)
+
+    def test_cache_lasts_one_render(self):
+        @log_template_errors(Mock())
+        def render_twice():
+            return self.render(['rows/a.html']) + self.render(['rows/a.html'])
+
+        with patch('pedant.includes._load',
+                   Mock(wraps=includes._load)) as load:
+            self.assertEqual(render_twice(), 'aa')
+        self.assertEqual(load.call_count, 2)
+
+    def test_render_errors_propagate_unchanged(self):
+        class Row(object):
+            def boom(self):
+                raise ValueError('boom')
+        template = Template('{% include "rows/c.html" %}', name='list.html')
+
+        @fail_on_template_errors
+        def render():
+            return template.render(Context({'row': Row()}))
+
+        with self.assertRaises(ValueError):
+            render()
+
+    def test_render_errors_are_logged_without_debug(self):
+        class Row(object):
+            def boom(self):
+                raise ValueError('boom')
+        template = Template('A{% include "rows/c.html" %}B', name='list.html')
+        logger = Mock()
+
+        @log_template_errors(logger)
+        def render():
+            return template.render(Context({'row': Row()}))
+
+        self.assertEqual(render(), 'AB')
+        self.assertIn("failed to render 'rows/c.html': ValueError: boom",
+                      logger.log.call_args[0][1])
+        with patch('pedant.includes._debug', return_value=True):
+            with self.assertRaises(ValueError):
+                render()
+
+
+class TestCost(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        for name, source in (
+                ('base.html', '{% block title %}{{ site.name }}{% endblock %}'
+                              '{% block body %}{% endblock %}'),
+                ('list.html', '{% extends "base.html" %}{% block body %}'
+                              '{% for o in orders %}{% for l in o.lines %}'
+                              '{% include "row.html" %}{{ l.name|upper }}'
+                              '{% endfor %}{% endfor %}{% endblock %}'),
+                ('row.html', '{{ l.price|floatformat:2 }}'),
+                ('if.html', '{% if a %}{{ a.b.c }}{% else %}x{% endif %}')):
+            with open(os.path.join(self.directory, name), 'w') as f:
+                f.write(source)
+
+    def test_estimate(self):
+        estimates = cost.estimate_all([self.directory])
+        self.assertEqual([estimate.name for estimate in estimates],
+                         ['list.html', 'base.html', 'if.html', 'row.html'])
+        loops = estimates[0]
+        self.assertEqual(
+            (loops.loop_depth, loops.loop_includes, loops.loop_lookups,
+             loops.filters, sorted(loops.blocks)),
+            (2, 1, 2, 2, ['body', 'title']))
+        # The if and the lookup in its condition, and its most expensive
+        # branch, {{ a.b.c }}.
+        self.assertEqual(estimates[2].cost, (1 + 1) + (1 + 3))
+
+    def test_weights(self):
+        estimates = cost.estimate_all([self.directory],
+                                      weights={'loop_iterations': 1})
+        self.assertEqual(estimates[0].name, 'list.html')
+        self.assertLess(estimates[0].cost, 100)
+
+    def test_calibrate(self):
+        estimates = cost.estimate_all([self.directory])
+        by_name = dict((estimate.name, estimate) for estimate in estimates)
+        baseline = {'row.html': {'median': by_name['row.html'].cost * 1e-6}}
+        self.assertAlmostEqual(cost.calibrate(estimates, baseline), 1e-6)
+        self.assertIsNone(cost.calibrate(estimates, {}))
+        report = cost.report(estimates, baseline).splitlines()
+        self.assertIn('Predicted ms', report[0])
+        self.assertTrue(report[1].startswith('list.html'))
+
+    def test_command(self):
+        stdout = StringIO()
+        with patch('pedant.checker.template_directories',
+                   return_value=[self.directory]):
+            call_command('pedant_cost', limit=1,
+                         baseline=os.path.join(self.directory, 'none.json'),
+                         stdout=stdout)
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith('list.html'))
+
+
+@override_settings(DEBUG=True)
+class TestPanel(TestCase):
+    def setUp(self):
+        from django.contrib.contenttypes.models import ContentType
+        self.row = Template('{{ item.model }}{{ missing }}', name='row.html')
+        self.page = Template(
+            '<body>{{ items.count }}\n'
+            '{% for item in items %}{% include row %}{% endfor %}</body>',
+            name='page.html')
+        self.context = {'items': ContentType.objects.all(), 'row': self.row}
+
+    def request(self):
+        middleware = PedanticPanelMiddleware()
+        request = RequestFactory().get('/page/')
+        middleware.process_request(request)
+        response = HttpResponse(self.page.render(Context(self.context)))
+        return request, middleware.process_response(request, response)
+
+    def test_record(self):
+        request, response = self.request()
+        record = request.pedant_panel
+        self.assertEqual(record.path, '/page/')
+        self.assertEqual([(name, depth) for name, depth, _ in
+                          record.templates][:3],
+                         [('page.html', 0), ('row.html', 1),
+                          ('row.html', 1)])
+        self.assertEqual(set(template for template, _ in record.errors),
+                         set(['row.html']))
+        count, evaluation = record.queries[:2]
+        self.assertEqual(count[:3], ('page.html', 1, 'items.count'))
+        self.assertEqual(evaluation[:3], ('page.html', 2, 'items'))
+        self.assertIn('COUNT', count[3])
+        self.assertIn(b'id="pedant-overlay"', response.content)
+        self.assertTrue(response.content.endswith(b'</body>'))
+        self.assertIn(record, panel.recent())
+
+    def test_view(self):
+        request, _ = self.request()
+        response = panel.panel_view(RequestFactory().get('/pedant/'))
+        self.assertIn(b'/page/', response.content)
+        with override_settings(DEBUG=False):
+            self.assertEqual(
+                panel.panel_view(RequestFactory().get('/pedant/')).status_code,
+                404)
+
+    def test_overlapping_requests(self):
+        from django.db.backends.utils import CursorWrapper
+        originals = (get_string_if_invalid(), Template.__dict__['render'],
+                     CursorWrapper.__dict__['execute'])
+        first = panel.panel_recording('/first/')
+        second = panel.panel_recording('/second/')
+        first_record = first.__enter__()
+        second_record = second.__enter__()
+        self.row.render(Context({}))
+        first.__exit__(None, None, None)
+        self.row.render(Context({}))
+        second.__exit__(None, None, None)
+        self.assertEqual(first_record.errors, [])
+        self.assertEqual(len(second_record.errors), 4)
+        self.assertEqual(
+            (get_string_if_invalid(), Template.__dict__['render'],
+             CursorWrapper.__dict__['execute']), originals)
+
+    def test_off_without_debug(self):
+        with override_settings(DEBUG=False):
+            request, response = self.request()
+        self.assertFalse(hasattr(request, 'pedant_panel'))
+        self.assertNotIn(b'pedant-overlay', response.content)
@@ -1,8 +1,15 @@
+import sys
+import types
+
+import django
+from django.template import Context
+from django.template import RequestContext
 from django.template import Template
+from django.template.loader import get_template
 from django.template.loader import render_to_string
-from django.test import TestCase
 
 from pedant.decorators import fail_on_template_errors
+from pedant.streaming import stream_template
 
 
 class PedanticTemplate(Template):
@@ -22,16 +29,50 @@ def render_to_string_pedantically(*args, **kwargs):
     return render_to_string(*args, **kwargs)
 
 
-class PedanticTestCaseMixin(object):
+def stream_pedantically(template_name, context=None, request=None):
     """
-    Mixin that runs all tests in a TestCase with pedantic rendering.
+    Like render_to_string_pedantically, but returns an iterator of chunks
+    that can be passed to StreamingHttpResponse.
     """
-    @fail_on_template_errors
-    def run(self, *args, **kwargs):
-        super(PedanticTestCaseMixin, self).run(*args, **kwargs)
+    template = get_template(template_name)
+    if django.VERSION >= (1, 8):
+        template = template.template
+    if request is None:
+        context = Context(context)
+    else:
+        context = RequestContext(request, context)
+    return stream_template(template, context)
 
 
-class PedanticTestCase(PedanticTestCaseMixin, TestCase):
+class _Module(types.ModuleType):
     """
-    Django TestCase that runs all tests with pedantic rendering.
+    Stand-in for this module that imports the test cases on first use.
+
+    ``PedanticTestCase`` and ``PedanticTestCaseMixin`` live in
+    ``pedant.testcases`` so that importing ``pedant.utils`` doesn't import
+    ``django.test``, but can still be imported from here. Everything else,
+    including setting attributes, goes to the real module.
     """
+    _lazy = ('PedanticTestCase', 'PedanticTestCaseMixin')
+
+    def __init__(self, module):
+        super(_Module, self).__init__(module.__name__, module.__doc__)
+        self.__dict__['_module'] = module
+
+    def __getattr__(self, name):
+        if name in self._lazy:
+            from pedant import testcases
+            return getattr(testcases, name)
+        return getattr(self._module, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._module, name, value)
+
+    def __delattr__(self, name):
+        delattr(self._module, name)
+
+    def __dir__(self):
+        return sorted(set(dir(self._module)) | set(self._lazy))
+
+
+sys.modules[__name__] = _Module(sys.modules[__name__])
@@ -21,6 +21,8 @@ DATABASES = {
 SECRET_KEY = '*#^6m1-xu$k_!x-#)h30f1m2uvp65ea#jjx%0mk4#oumgzw4ld'
 
 INSTALLED_APPS = (
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
     'django_nose',
     'pedant',
 )
@@ -21,4 +21,7 @@ setup(
         str(ir.req) for ir in parse_requirements('./requirements.txt',
                                                  session=PipSession())],
     zip_safe=False,
+    entry_points={
+        'pytest11': ['pedant = pedant.pytest_plugin'],
+    },
 )